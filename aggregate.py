@@ -0,0 +1,177 @@
+import numpy as np
+
+
+def ranking_order(importances, feature_order):
+    """
+    Indices of the features from the most to the least important, as in
+    sorted(zip(map(lambda x: round(x, 4), importances), feature_order), reverse=True).
+
+    Parameters
+    ----------
+    importances:
+        importance of every feature, ordered as feature_order.
+    feature_order:
+        a list of strings (features' names).
+
+    Returns
+    -------
+    order: numpy array of feature indices.
+
+    """
+    rounded = np.round(np.asarray(importances, dtype=np.float64), 4)
+    name_rank = np.argsort(np.argsort(np.asarray(feature_order, dtype=str), kind="stable"), kind="stable")
+    # lexsort sorts by the last key first: importance descending, then name descending.
+    return np.lexsort((-name_rank, -rounded))
+
+
+def rank_frequency(Ls, feature_order):
+    """
+    Count how often every feature is at every rank in a list of rankings.
+
+    Parameters
+    ----------
+    Ls:
+        a list of rankings, each a list of (importance, feature name) tuples sorted by decreasing importance.
+    feature_order:
+        a list of strings (features' names).
+
+    Returns
+    -------
+    frequency: numpy array of shape (# of features, # of ranks). frequency[i, r] is the number of rankings in which
+        feature_order[i] is at rank r.
+
+    """
+    index = {f: i for i, f in enumerate(feature_order)}
+    frequency = np.zeros((len(feature_order), len(feature_order)), dtype=np.int64)
+    for ranking in Ls:
+        frequency[[index[name] for importance, name in ranking], np.arange(len(ranking))] += 1
+    return frequency
+
+
+class RunAggregator(object):
+    """
+    Constant-memory summary of repeated classification runs.
+
+    It keeps rank-frequency matrices of (Gini and permutation) feature importances, a running confusion matrix, and a
+    running mean and variance (Welford) of every scalar metric such as accuracy or AUC. Every update costs
+    O(# of features) (plus the size of the confusion matrix), and aggregators filled by different workers can be
+    merged.
+
+    Attributes
+    ----------
+    feature_order:
+        a list of strings (features' names), the rows of rank_frequency.
+    labels:
+        labels of the rows and columns of confusion_matrix, or `None`.
+    rank_frequency:
+        numpy array of shape (# of features, # of ranks); see rank_frequency.
+    permutation_frequency:
+        same as rank_frequency, for the rankings by permutation importance.
+    confusion_matrix:
+        sum of the confusion matrices, or `None` if no run had one.
+    n_runs:
+        number of runs added.
+
+    """
+
+    def __init__(self, feature_order, labels=None):
+        self.feature_order = list(feature_order)
+        self.labels = labels
+        self.rank_frequency = np.zeros((len(self.feature_order), len(self.feature_order)), dtype=np.int64)
+        self.permutation_frequency = np.zeros_like(self.rank_frequency)
+        self.confusion_matrix = None
+        self.n_runs = 0
+        self._index = {f: i for i, f in enumerate(self.feature_order)}
+        self._moments = {}
+
+    def update(self, cm=None, feature_importances=None, permutation_importances=None, **metrics):
+        """
+        Add one run.
+
+        Parameters
+        ----------
+        cm:
+            confusion matrix of the run.
+        feature_importances:
+            either a ranking (a list of (importance, feature name) tuples sorted by decreasing importance) or a
+            numpy array of the importance of every feature ordered as feature_order.
+        permutation_importances:
+            same as feature_importances, for permutation importance.
+        metrics:
+            scalar metrics of the run, e.g. accuracy=0.9, auc=0.8.
+
+        """
+        self.n_runs += 1
+
+        if cm is not None:
+            cm = np.asarray(cm)
+            self.confusion_matrix = cm.copy() if self.confusion_matrix is None else self.confusion_matrix + cm
+
+        for importances, frequency in ((feature_importances, self.rank_frequency),
+                                       (permutation_importances, self.permutation_frequency)):
+            if importances is None:
+                continue
+            if isinstance(importances, np.ndarray):
+                order = ranking_order(importances, self.feature_order)
+            else:
+                order = [self._index[name] for importance, name in importances]
+            frequency[order, np.arange(len(order))] += 1
+
+        for name, value in metrics.items():
+            self.add_metric(name, value)
+
+    def add_metric(self, name, value):
+        count, mean, m2 = self._moments.get(name, (0, 0.0, 0.0))
+        count += 1
+        delta = value - mean
+        mean += delta / count
+        m2 += delta * (value - mean)
+        self._moments[name] = (count, mean, m2)
+
+    def merge(self, other):
+        """
+        Add all the runs of another aggregator (e.g. filled by another worker) to this one.
+        """
+        if other.feature_order != self.feature_order:
+            raise ValueError("cannot merge aggregators over different features")
+
+        self.n_runs += other.n_runs
+        self.rank_frequency += other.rank_frequency
+        self.permutation_frequency += other.permutation_frequency
+        if other.confusion_matrix is not None:
+            self.confusion_matrix = other.confusion_matrix.copy() if self.confusion_matrix is None \
+                else self.confusion_matrix + other.confusion_matrix
+            if self.labels is None:
+                self.labels = other.labels
+
+        # parallel variant of Welford's algorithm (Chan et al.).
+        for name, (n_b, mean_b, m2_b) in other._moments.items():
+            n_a, mean_a, m2_a = self._moments.get(name, (0, 0.0, 0.0))
+            n = n_a + n_b
+            delta = mean_b - mean_a
+            self._moments[name] = (n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n)
+        return self
+
+    def count(self, name):
+        return self._moments.get(name, (0, 0.0, 0.0))[0]
+
+    def mean(self, name):
+        count, mean, m2 = self._moments.get(name, (0, float("nan"), 0.0))
+        return mean
+
+    def variance(self, name):
+        """
+        Sample variance of a metric.
+        """
+        count, mean, m2 = self._moments.get(name, (0, 0.0, 0.0))
+        return m2 / (count - 1) if count > 1 else float("nan")
+
+    def mean_rank(self, permutation=False):
+        """
+        Mean importance rank (1 for the most important) of every feature of feature_order over the runs, by Gini
+        importance or, if permutation is `True`, by permutation importance.
+        """
+        frequency = self.permutation_frequency if permutation else self.rank_frequency
+        runs = frequency.sum(axis=1)
+        with np.errstate(invalid='ignore'):
+            return frequency.dot(np.arange(1, frequency.shape[1] + 1)) / runs
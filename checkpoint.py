@@ -0,0 +1,128 @@
+import os
+import json
+import numpy as np
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def _read(path):
+    """
+    Header and records of a log, and the size of its complete lines. Reading stops at the first line that is cut
+    short or not valid JSON, i.e. at the record being written when the process was killed.
+    """
+    header, records, size = None, {}, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line.decode("utf-8"))
+            except ValueError:
+                break
+            size += len(line)
+            if header is None:
+                header = entry
+            else:
+                records[entry["iteration"]] = entry
+    return header, records, size
+
+
+def stored_config(path):
+    """
+    Configuration saved in the header of a checkpoint log, or `None` if there is no log at path.
+    """
+    if not os.path.exists(path):
+        return None
+    return _read(path)[0]
+
+
+def replay(path):
+    """
+    Configuration and records of a checkpoint log, without opening it for writing.
+
+    Returns
+    -------
+    config: `dict`
+        configuration saved in the header of the log.
+    records: `list`
+        records of the log (dicts), by increasing iteration number.
+
+    """
+    header, records, size = _read(path)
+    return header, [records[i] for i in sorted(records)]
+
+
+class CheckpointLog(object):
+    """
+    Append-only log of the results of the iterations of a repeated experiment, from which an interrupted experiment
+    resumes.
+
+    The log is a text file of JSON lines: the first one holds the configuration of the experiment, and every other
+    one the result of an iteration, written and flushed to disk as soon as the iteration ends. Opening an existing
+    log replays it into records; a last line cut short by a crash is dropped, so at most the iterations that were
+    running are lost.
+
+    Attributes
+    ----------
+    path:
+        path of the log file.
+    config: `dict`
+        configuration of the experiment (JSON serializable).
+    records: `dict`
+        iteration number -> record (a dict) of every iteration in the log.
+
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = json.loads(json.dumps(config, default=_to_json))
+        self.records = {}
+
+        if os.path.exists(path):
+            header, self.records, size = _read(path)
+            if header is not None and header != self.config:
+                raise ValueError("checkpoint %s was written by an experiment with another configuration: %r"
+                                 % (path, header))
+            if size != os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+            if header is None:
+                self.records = {}
+
+        self._file = open(path, 'a')
+        if not self._file.tell():
+            self._write(self.config)
+
+    def missing(self, n):
+        """
+        Iterations among the first n that are not in the log, in increasing order.
+        """
+        return [i for i in range(n) if i not in self.records]
+
+    def append(self, iteration, **record):
+        """
+        Write the record of an iteration at the end of the log and flush it to disk.
+        """
+        record["iteration"] = iteration
+        self._write(record)
+        self.records[iteration] = json.loads(json.dumps(record, default=_to_json))
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, default=_to_json) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
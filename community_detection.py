@@ -1,18 +1,114 @@
+import ast
+import random
 import igraph
-import sys
+import numpy as np
+import scipy.sparse as sp
 
+import click
 
-def main(filepath):
-    G = igraph.Graph.Read_Ncol(filepath, directed=False)
-    vertices = G.community_fastgreedy(weights="weight").as_clustering()
-    tuple_L = sum([map(lambda x: (x, i), L) for i, L in enumerate(list(vertices))], [])
-    tuple_L_name = [(int(G.vs(id)["name"][0]), c) for id, c in tuple_L]
-    tuple_L_sorted = sorted(tuple_L_name, key=lambda x: x[0])
-    communities = [e[1] for e in tuple_L_sorted]
-    print(communities)
+
+# name -> function(graph) returning the vertex clustering of a graph with a "weight" edge attribute.
+METHODS = {
+    "fastgreedy": lambda G: G.community_fastgreedy(weights="weight").as_clustering(),
+    "louvain": lambda G: G.community_multilevel(weights="weight"),
+    "leiden": lambda G: G.community_leiden(objective_function="modularity", weights="weight", n_iterations=-1),
+    "infomap": lambda G: G.community_infomap(edge_weights="weight"),
+}
+
+
+def weighted_graph(adj):
+    """
+    Undirected igraph graph with a "weight" edge attribute from a symmetric adjacency matrix.
+
+    Only the non-zero entries of the upper triangle are visited, so a sparse matrix of thousands of vertices is
+    never made dense.
+
+    Parameters
+    ----------
+    adj:
+        symmetric numpy array or scipy sparse matrix of edge weights; 0 means no edge. The diagonal is ignored.
+
+    Returns
+    -------
+    G: igraph.Graph with one vertex per row of adj.
+
+    """
+    upper = sp.triu(sp.coo_matrix(adj, dtype=np.float64), k=1).tocoo()
+    upper.eliminate_zeros()
+    G = igraph.Graph(n=adj.shape[0], edges=np.column_stack((upper.row, upper.col)).tolist())
+    G.es["weight"] = upper.data.tolist()
+    return G
+
+
+def detect_communities(adj, method="fastgreedy", random_state=None):
+    """
+    Communities of a weighted undirected graph given by its adjacency matrix (e.g. from multi_run.make_adj_matrix),
+    detected in memory.
+
+    Parameters
+    ----------
+    adj:
+        symmetric numpy array or scipy sparse matrix of edge weights; 0 means no edge.
+    method: `str`
+        "fastgreedy", "louvain", "leiden" (modularity) or "infomap".
+    random_state: `int`
+        seed of the randomized methods (louvain, leiden and infomap), or `None`.
+
+    Returns
+    -------
+    membership: numpy array of the community of every vertex (row of adj).
+
+    """
+    if method not in METHODS:
+        raise ValueError("unknown community detection method: %s" % method)
+
+    G = weighted_graph(adj)
+    if random_state is None:
+        return np.array(METHODS[method](G).membership)
+
+    # igraph draws from the random module: use a seeded generator of its own, then hand the module back.
+    igraph.set_random_number_generator(random.Random(random_state))
+    try:
+        return np.array(METHODS[method](G).membership)
+    finally:
+        igraph.set_random_number_generator(random)
+
+
+def read_edge_list(filepath):
+    """
+    Adjacency matrix of a weighted edge list whose vertices are numbered 0, 1, ..., as written by
+    nx.write_edgelist: every line is "u v", "u v weight" or "u v {'weight': weight}".
+    """
+    rows, cols, weights = [], [], []
+    with open(filepath, 'r') as f:
+        for line in f:
+            fields = line.split(None, 2)
+            if len(fields) < 2:
+                continue
+            weight = 1.0
+            if len(fields) == 3:
+                data = fields[2].strip()
+                weight = ast.literal_eval(data).get("weight", 1.0) if data.startswith("{") else float(data)
+            rows.append(int(fields[0]))
+            cols.append(int(fields[1]))
+            weights.append(weight)
+    n = max(rows + cols) + 1 if rows else 0
+    adj = sp.coo_matrix((weights, (rows, cols)), shape=(n, n)).tocsr()
+    return adj.maximum(adj.T)
+
+
+@click.command()
+@click.argument('filepath')
+@click.option('--method', nargs=1, type=click.Choice(sorted(METHODS)), default="fastgreedy",
+              help='Community detection algorithm.')
+@click.option('--seed', nargs=1, type=int, default=None, help='Seed of louvain, leiden and infomap.')
+def main(filepath, method, seed):
+    """
+    Print the community of every vertex of a weighted edge list (see read_edge_list), in the order of the vertex
+    numbers.
+    """
+    print(detect_communities(read_edge_list(filepath), method=method, random_state=seed).tolist())
 
 
 if __name__ == '__main__':
-    params = sys.argv
-    filepath = params[1]
-    main(filepath)
+    main()
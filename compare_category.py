@@ -1,4 +1,4 @@
-from preprocess import init
+from feature_store import init_cached
 import matplotlib.pyplot as plt
 
 
@@ -52,7 +52,7 @@ def main():
 
     isSubType = True
     at_least = 1
-    X, Y, sub_to_main_type, feature_order = init("features.csv", column_names, isSubType, at_least)
+    X, Y, sub_to_main_type, feature_order = init_cached("features.csv", column_names, isSubType, at_least)
     N = 100
 
     c1_name = "ER Network"
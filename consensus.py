@@ -0,0 +1,155 @@
+import os
+import numpy as np
+from checkpoint import replay, stored_config
+from community_detection import detect_communities, METHODS
+from matrix_utils import normalize_rows, symmetrize_max
+from parallel import parallel_map, spawn_seeds
+from shared import broadcast, attach
+
+import click
+
+
+def run_matrices(checkpoint, sampling_method=None):
+    """
+    Confusion matrices of every run of a multi_run experiment, read from its checkpoint log.
+
+    Parameters
+    ----------
+    checkpoint: `str`
+        path of the log written by multi_run.sum_confusion_matrix.
+    sampling_method: `str`
+        sampling method whose runs are read, for the log of a comparison of sampling methods.
+
+    Returns
+    -------
+    cms: numpy array of shape (# of runs, # of labels, # of labels).
+    labels: a list of the labels of the rows and columns.
+
+    """
+    config, records = replay(checkpoint)
+    if not isinstance(config["samplingMethod"], str):
+        if sampling_method is None:
+            raise ValueError("%s compares sampling methods: choose one of %s"
+                             % (checkpoint, ", ".join(config["samplingMethod"])))
+        records = [record["methods"][sampling_method] for record in records]
+    if not records:
+        raise ValueError("%s has no runs" % checkpoint)
+    return np.array([record["cm"] for record in records]), records[0]["labels"]
+
+
+# run confusion matrices and settings shared by all the bootstraps, attached once per worker process.
+_shared = {}
+
+
+def _install(handles, method):
+    _shared.clear()
+    _shared.update(attach(handles))
+    _shared.update(method=method)
+
+
+def _bootstrap(seed):
+    """
+    Communities of the confusion graph of a bootstrap sample of the runs: the runs are drawn with replacement and
+    their confusion matrices summed as multi_run.make_adj_matrix does for all of them.
+    """
+    cms = _shared["cms"]
+    rng = np.random.default_rng(seed)
+    counts = np.bincount(rng.integers(0, len(cms), len(cms)), minlength=len(cms))
+    cm = np.tensordot(counts, cms, axes=1)
+    return detect_communities(symmetrize_max(normalize_rows(cm)), method=_shared["method"], random_state=seed)
+
+
+def consensus_communities(cms, n_bootstraps=100, method="fastgreedy", random_state=None, n_jobs=1, threshold=0.0):
+    """
+    Consensus communities of the confusion graph over bootstrap samples of runs, with the stability of every class.
+
+    Every bootstrap sums the confusion matrices of runs drawn with replacement and detects the communities of its
+    graph; the bootstraps are spread over n_jobs processes (the matrices are broadcast once, see shared.broadcast)
+    and every membership is folded into a co-assignment matrix as soon as it comes back, so memory is
+    O(# of labels ** 2) whatever the number of bootstraps. The consensus communities are then detected on the graph
+    of co-assignment frequencies (Lancichinetti and Fortunato).
+
+    Parameters
+    ----------
+    cms:
+        numpy array of shape (# of runs, # of labels, # of labels), e.g. from run_matrices.
+    n_bootstraps: `int`
+        number of bootstrap samples.
+    method: `str`
+        community detection algorithm (see community_detection.detect_communities).
+    random_state: `int`
+        master seed of the bootstraps.
+    n_jobs: `int`
+        number of worker processes. -1 uses all CPUs.
+    threshold: `float`
+        co-assignment frequencies below threshold are dropped from the consensus graph.
+
+    Returns
+    -------
+    membership:
+        numpy array of the consensus community of every label.
+    stability:
+        numpy array of the stability of every label: the mean frequency with which it was put in the same community
+        as the other labels of its consensus community, or with which it was alone if it is alone.
+    co_assignment:
+        numpy array of shape (# of labels, # of labels) of the frequency with which two labels share a community.
+
+    """
+    cms = np.asarray(cms, dtype=np.float64)
+    n = cms.shape[1]
+    together = np.zeros((n, n), dtype=np.int64)
+    alone = np.zeros(n, dtype=np.int64)
+
+    with broadcast({"cms": cms}, n_jobs=n_jobs) as handles:
+        for membership in parallel_map(_bootstrap, spawn_seeds(random_state, n_bootstraps), n_jobs=n_jobs,
+                                       initializer=_install, initargs=(handles, method)):
+            together += membership[:, None] == membership[None, :]
+            alone += np.bincount(membership)[membership] == 1
+
+    co_assignment = together / float(n_bootstraps)
+    consensus = np.where(co_assignment >= threshold, co_assignment, 0.0)
+    membership = detect_communities(consensus, method=method, random_state=random_state)
+
+    same = membership[:, None] == membership[None, :]
+    np.fill_diagonal(same, False)
+    sizes = same.sum(axis=1)
+    with np.errstate(invalid='ignore'):
+        stability = np.where(sizes > 0, (co_assignment * same).sum(axis=1) / sizes, alone / float(n_bootstraps))
+    return membership, stability, co_assignment
+
+
+@click.command()
+@click.option('--checkpoint', nargs=1, type=str, help='Checkpoint log of a multi_run experiment.')
+@click.option('--sampling', nargs=1, type=str, default=None,
+              help='Sampling method whose runs are used, for a log comparing sampling methods.')
+@click.option('--bootstraps', nargs=1, type=int, default=100, help='Number of bootstrap samples of the runs.')
+@click.option('--communities', nargs=1, type=click.Choice(sorted(METHODS)), default='fastgreedy',
+              help='Community detection algorithm.')
+@click.option('--threshold', nargs=1, type=float, default=0.0,
+              help='Co-assignment frequencies below it are dropped from the consensus graph.')
+@click.option('--seed', nargs=1, type=int, default=None, help='Master seed of the bootstraps.')
+@click.option('--jobs', nargs=1, type=int, default=1, help='Number of worker processes (-1 for all CPUs).')
+@click.option('--out', nargs=1, type=str, default='.', help='Output directory.')
+def main(checkpoint, sampling, bootstraps, communities, threshold, seed, jobs, out):
+    """
+    Write consensus_<method>.txt with the consensus community of every label, one per line as read by
+    graph_draw.read_community, and stability_<method>.txt with "<label>,<community>,<stability>" lines.
+    """
+    cms, labels = run_matrices(checkpoint, sampling_method=sampling)
+    membership, stability, co_assignment = consensus_communities(
+        cms, n_bootstraps=bootstraps, method=communities, random_state=seed, n_jobs=jobs, threshold=threshold
+    )
+
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    name = sampling or stored_config(checkpoint)["samplingMethod"]
+    np.savetxt(os.path.join(out, "consensus_%s.txt" % name), membership, fmt="%d")
+    with open(os.path.join(out, "stability_%s.txt" % name), 'w') as f:
+        for label, community, value in zip(labels, membership, stability):
+            f.write("%s,%d,%.4f\n" % (label, community, value))
+    print("%d runs, %d bootstraps: %d communities, mean stability %.4f"
+          % (len(cms), bootstraps, len(set(membership)), stability.mean()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import os
+import csv
+import sys
+import json
+import random
+import igraph
+from collections import OrderedDict
+from functools import partial
+from parallel import map_with_timeout
+from feature_store import file_digests
+import path_features
+import motifs
+
+import click
+
+
+GRAPH_EXTENSIONS = (".gml", ".txt", ".edges", ".edgelist", ".ncol")
+
+
+def read_graph(filepath):
+    """
+    Read a network from a GML or edge-list file as a simple undirected graph.
+    """
+    if filepath.lower().endswith(".gml"):
+        G = igraph.Graph.Read_GML(filepath)
+    else:
+        G = igraph.Graph.Read_Ncol(filepath, names=True, weights=False, directed=False)
+    G.to_undirected()
+    G.simplify()
+    return G
+
+
+def _motif(i):
+    def motif(G, method="exact"):
+        counts, record = motifs.motif_counts(G, method)
+        return counts[i], record
+    return motif
+
+
+def modularity(G, seed=0):
+    """
+    Modularity of the communities found by the multilevel (Louvain) algorithm. igraph draws the order of the vertices
+    from the random module, so it is given its own generator with a fixed seed for every graph and the value does not
+    depend on the run or on the graphs processed before.
+    """
+    igraph.set_random_number_generator(random.Random(seed))
+    try:
+        return G.community_multilevel().modularity
+    finally:
+        igraph.set_random_number_generator(random)
+
+
+# feature name in features.csv -> function computing it from an igraph.Graph.
+FEATURES = OrderedDict([
+    ("NumberOfNodes", lambda G: float(G.vcount())),
+    ("NumberOfEdges", lambda G: float(G.ecount())),
+    ("MeanDegree", lambda G: 2.0 * G.ecount() / G.vcount()),
+    ("MeanGeodesicDistance", lambda G: G.average_path_length(directed=False)),
+    ("Diameter", lambda G: float(G.diameter(directed=False))),
+    ("ClusteringCoefficient", lambda G: G.transitivity_undirected()),
+    ("DegreeAssortativity", lambda G: G.assortativity_degree(directed=False)),
+    ("Modularity", modularity),
+] + [("m4_%d" % (i + 1), lambda G, i=i: motifs.motif_counts(G)[0][i]) for i in range(6)])
+
+# features that can be estimated on large networks -> function(G, method) returning the value and the estimator
+# actually used (see path_features.parse_method and motifs.motif_counts). The estimator is written in a
+# "<feature>_approx" column.
+APPROXIMATE = OrderedDict([
+    ("MeanGeodesicDistance", path_features.mean_geodesic_distance),
+    ("Diameter", path_features.diameter),
+] + [("m4_%d" % (i + 1), _motif(i)) for i in range(6)])
+
+
+def approx_column(name):
+    return name + "_approx"
+
+
+def columns(features):
+    """
+    Columns of the feature table for the given features, with the estimator column next to every approximable one.
+    """
+    names = []
+    for name in features:
+        names += [name, approx_column(name)] if name in APPROXIMATE else [name]
+    return names
+
+
+def compute_features(filepath, features, approx=None):
+    """
+    Compute features of the network stored in a file.
+
+    Parameters
+    ----------
+    filepath:
+        path to a GML or edge-list file.
+    features:
+        names of features, keys of FEATURES.
+    approx: `dict`
+        feature name -> estimator, e.g. {"MeanGeodesicDistance": "pivots,k=256,seed=0"}, for features of APPROXIMATE.
+        Other features are computed exactly.
+
+    Returns
+    -------
+    values: `dict`
+        feature name -> value, and "<feature>_approx" -> estimator actually used for features of APPROXIMATE.
+
+    """
+    G = read_graph(filepath)
+    values = {}
+    counts = {}
+    for name in features:
+        method = (approx or {}).get(name, "exact")
+        if name.startswith("m4_"):
+            # all six motif counts come from the same computation.
+            if method not in counts:
+                counts[method] = motifs.motif_counts(G, method)
+            values[name], values[approx_column(name)] = counts[method][0][int(name[3:]) - 1], counts[method][1]
+        elif name in APPROXIMATE:
+            values[name], values[approx_column(name)] = APPROXIMATE[name](G, method)
+        else:
+            values[name] = FEATURES[name](G)
+    return values
+
+
+def read_labels(filepath):
+    """
+    Read a csv file with .gmlFile, NetworkType and SubType columns into a dict: gml file name -> (NetworkType, SubType).
+    """
+    with open(filepath, 'r') as f:
+        return dict((row[".gmlFile"], (row["NetworkType"], row["SubType"])) for row in csv.DictReader(f))
+
+
+def labels_from_path(filepath, root):
+    """
+    NetworkType and SubType of a network stored as root/NetworkType/SubType/name.gml. Missing levels are empty.
+    """
+    parts = os.path.relpath(os.path.dirname(filepath), root).split(os.sep)
+    parts = [p for p in parts if p not in ("", ".")]
+    return (parts + ["", ""])[0], (parts + ["", ""])[1]
+
+
+def find_graphs(directory):
+    """
+    Paths of all the network files under a directory, sorted.
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        paths += [os.path.join(dirpath, f) for f in filenames if f.lower().endswith(GRAPH_EXTENSIONS)]
+    return sorted(paths)
+
+
+def check_features(features, approx=None):
+    """
+    Raise a ValueError for unknown features and invalid estimators.
+    """
+    unknown = [name for name in features if name not in FEATURES]
+    if unknown:
+        raise ValueError("unknown features: %s" % ", ".join(unknown))
+    not_approximable = [name for name in (approx or {}) if name not in APPROXIMATE]
+    if not_approximable:
+        raise ValueError("features without estimators: %s" % ", ".join(not_approximable))
+    for name, method in (approx or {}).items():
+        path_features.parse_method(method, names=("exact", "edges") if name.startswith("m4_") else
+                                   ("exact", "pivots", "hyperanf"))
+
+
+def extract_features(directory, output, features, labels=None, n_jobs=1, timeout=None, approx=None):
+    """
+    Compute features of every network under a directory and write them to a csv file in the format of features.csv.
+
+    Every network is processed in its own worker process, at most n_jobs at a time, and rows are written as soon as
+    their network is done. Networks that fail or take longer than timeout seconds are reported on stderr and left out.
+
+    Parameters
+    ----------
+    directory:
+        directory containing GML or edge-list files, possibly in NetworkType/SubType sub-directories.
+    output:
+        path of the csv file to write.
+    features:
+        names of features, keys of FEATURES.
+    labels:
+        dict: gml file name -> (NetworkType, SubType), e.g. from read_labels. If `None`, labels are taken from the
+        sub-directories.
+    n_jobs: `int`
+        number of networks processed at the same time. -1 uses all CPUs.
+    timeout: `float`
+        time limit per network in seconds.
+    approx: `dict`
+        feature name -> estimator for large networks; see compute_features.
+
+    Returns
+    -------
+    n_written: `int`
+        number of rows written.
+
+    """
+    check_features(features, approx)
+
+    paths = find_graphs(directory)
+    n_written = 0
+
+    with open(output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[".gmlFile", "NetworkType", "SubType"] + columns(features))
+        writer.writeheader()
+        f.flush()
+
+        for path, status, values in map_with_timeout(partial(compute_features, features=features, approx=approx), paths,
+                                                     n_jobs=n_jobs, timeout=timeout):
+            name = os.path.basename(path)
+            if status != "ok":
+                sys.stderr.write("%s: %s %s\n" % (path, status, values or ""))
+                continue
+
+            network_type, sub_type = labels[name] if labels and name in labels else labels_from_path(path, directory)
+            row = {".gmlFile": name, "NetworkType": network_type, "SubType": sub_type}
+            row.update(values)
+            writer.writerow(row)
+            f.flush()
+            n_written += 1
+
+    return n_written
+
+
+def _cache_file(cache_dir, digest):
+    return os.path.join(cache_dir, digest[:2], digest + ".json")
+
+
+def cached_values(cache_dir, digest):
+    """
+    Feature values cached for the network file with the given content digest: feature name -> value.
+    """
+    path = _cache_file(cache_dir, digest)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def cache_values(cache_dir, digest, values):
+    """
+    Add feature values of the network file with the given content digest to the cache.
+    """
+    path = _cache_file(cache_dir, digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    merged = cached_values(cache_dir, digest)
+    merged.update(values)
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(merged, f)
+    os.replace(tmp, path)
+
+
+def _compute_task(task):
+    filepath, features, approx = task
+    return compute_features(filepath, features, approx)
+
+
+# feature name -> version of its computation, for features whose values cached by earlier versions are not reused
+# (Modularity was not seeded).
+FEATURE_VERSIONS = {"Modularity": 2}
+
+
+def cache_key(name, approx=None):
+    """
+    Key of a feature value in the cache: estimated values are cached apart from exact ones, per estimator, and
+    values of another version of a feature (see FEATURE_VERSIONS) apart from the current ones.
+    """
+    method = (approx or {}).get(name, "exact")
+    key = name if method == "exact" else "%s@%s" % (name, method)
+    return key if name not in FEATURE_VERSIONS else "%s#%d" % (key, FEATURE_VERSIONS[name])
+
+
+def read_table(filepath):
+    """
+    Read a features.csv into its column names and an ordered dict: gml file name -> row dict.
+    """
+    if not os.path.exists(filepath):
+        return [".gmlFile", "NetworkType", "SubType"], OrderedDict()
+    with open(filepath, 'r') as f:
+        reader = csv.DictReader(f)
+        return list(reader.fieldnames), OrderedDict((row[".gmlFile"], row) for row in reader)
+
+
+def update_features(directory, output, features, cache_dir, labels=None, n_jobs=1, timeout=None, approx=None):
+    """
+    Incremental version of extract_features.
+
+    Feature values are cached per (content digest of the network file, feature name and estimator) in cache_dir, and
+    only the
+    values missing from the cache are computed, so adding a network costs one network and adding a feature costs one
+    column. The values of the networks under directory are then merged into output: existing rows and columns are
+    kept, rows of these networks are updated, and new networks and features are added.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory of the per-network caches.
+    Other parameters are the same as extract_features.
+
+    Returns
+    -------
+    n_computed: `int`
+        number of networks for which some value had to be computed.
+
+    """
+    check_features(features, approx)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = find_graphs(directory)
+    digests = file_digests(paths, cache_dir)
+    values = dict((path, cached_values(cache_dir, digests[path])) for path in paths)
+
+    tasks = [(path, [name for name in features if cache_key(name, approx) not in values[path]], approx)
+             for path in paths]
+    tasks = [task for task in tasks if task[1]]
+
+    for (path, missing, approx), status, computed in map_with_timeout(_compute_task, tasks, n_jobs=n_jobs,
+                                                                      timeout=timeout):
+        if status != "ok":
+            sys.stderr.write("%s: %s %s\n" % (path, status, computed or ""))
+            continue
+        keyed = dict((cache_key(name, approx), computed[name]) for name in missing)
+        keyed.update((approx_column(cache_key(name, approx)), computed[approx_column(name)])
+                     for name in missing if name in APPROXIMATE)
+        cache_values(cache_dir, digests[path], keyed)
+        values[path].update(keyed)
+
+    fieldnames, rows = read_table(output)
+    fieldnames += [name for name in columns(features) if name not in fieldnames]
+
+    for path in paths:
+        name = os.path.basename(path)
+        network_type, sub_type = labels[name] if labels and name in labels else labels_from_path(path, directory)
+        row = rows.setdefault(name, {".gmlFile": name})
+        row.update({"NetworkType": network_type, "SubType": sub_type})
+        for name in features:
+            key = cache_key(name, approx)
+            if key in values[path]:
+                row[name] = values[path][key]
+                if name in APPROXIMATE:
+                    # values cached before estimators were recorded are exact.
+                    row[approx_column(name)] = values[path].get(approx_column(key), "exact")
+
+    tmp = "%s.%d.tmp" % (output, os.getpid())
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows.values())
+    os.replace(tmp, output)
+
+    return len(tasks)
+
+
+@click.command()
+@click.option('--input', 'directory', nargs=1, type=str, help='Directory of GML or edge-list files.')
+@click.option('--output', nargs=1, type=str, default='features.csv', help='CSV file to write.')
+@click.option('--feature', '-f', multiple=True, help='Feature to compute (default: all).')
+@click.option('--labels', nargs=1, type=str, default=None,
+              help='CSV with .gmlFile, NetworkType and SubType columns (default: from sub-directories).')
+@click.option('--jobs', nargs=1, type=int, default=1, help='Number of networks processed in parallel (-1 for all CPUs).')
+@click.option('--timeout', nargs=1, type=float, default=None, help='Time limit per network in seconds.')
+@click.option('--cache', nargs=1, type=str, default=None,
+              help='Cache directory; only missing values are computed and merged into the output.')
+@click.option('--approx', multiple=True,
+              help='Estimator of a path-based feature, e.g. MeanGeodesicDistance=pivots,k=256,seed=0, '
+                   'MeanGeodesicDistance=hyperanf,log2m=6, Diameter=pivots,epsilon=0.05,time=60 or '
+                   'm4=edges,fraction=0.01,seed=0 (all motif columns).')
+def main(directory, output, feature, labels, jobs, timeout, cache, approx):
+    features = list(feature) or list(FEATURES)
+    labels = read_labels(labels) if labels else None
+    approx = dict(spec.split("=", 1) for spec in approx)
+    if "m4" in approx:
+        method = approx.pop("m4")
+        approx.update(("m4_%d" % (i + 1), method) for i in range(6))
+    if cache:
+        n_computed = update_features(directory, output, features, cache, labels=labels, n_jobs=jobs, timeout=timeout,
+                                     approx=approx)
+        print("%d networks computed, %s updated" % (n_computed, output))
+    else:
+        n_written = extract_features(directory, output, features, labels=labels, n_jobs=jobs, timeout=timeout,
+                                     approx=approx)
+        print("%d networks written to %s" % (n_written, output))
+
+
+if __name__ == '__main__':
+    main()
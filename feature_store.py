@@ -0,0 +1,213 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from preprocess import init
+
+
+def file_digests(filepaths, cache_dir=None):
+    """
+    sha256 hex digests of the content of files.
+
+    If cache_dir is given, digests are remembered there together with the size and modification time of every file,
+    and are only recomputed when either changes.
+
+    Returns
+    -------
+    digests: `dict`
+        file path -> digest.
+
+    """
+    index_path = os.path.join(cache_dir, "digests.json") if cache_dir else None
+    index = {}
+    if index_path and os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+
+    digests = {}
+    changed = False
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        key = os.path.abspath(filepath)
+        entry = index.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            digests[filepath] = entry["digest"]
+            continue
+
+        sha = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digests[filepath] = sha.hexdigest()
+        index[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digests[filepath]}
+        changed = True
+
+    if index_path and changed:
+        _atomic_write_json(index_path, index)
+    return digests
+
+
+def file_digest(filepath, cache_dir=None):
+    """
+    sha256 hex digest of the content of a file; see file_digests.
+    """
+    return file_digests([filepath], cache_dir)[filepath]
+
+
+def _atomic_write_json(path, obj):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def store_key(digest, column_names, isSubType, at_least, **kwargs):
+    """
+    Name of the store holding the output of init for the given csv digest and arguments.
+    """
+    params = {"digest": digest, "column_names": sorted(column_names), "isSubType": bool(isSubType),
+              "at_least": at_least, "kwargs": sorted((k, sorted(v) if isinstance(v, (list, tuple, set)) else v)
+                                                     for k, v in kwargs.items())}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def save_store(directory, X, Y, sub_to_main_type, feature_order):
+    """
+    Write the output of init into a directory of .npy/.npz files.
+
+    The store is written next to the target and renamed into place, so concurrent writers and readers never see a
+    partial store.
+
+    Parameters
+    ----------
+    directory:
+        path of the store.
+    X:
+        numpy array for features.
+    Y:
+        numpy array for class labels.
+    sub_to_main_type:
+        dict mapping network sub-type to network type.
+    feature_order:
+        a list of strings (features' names) ordered for the feature array X.
+
+    """
+    tmp = "%s.%d.tmp" % (directory.rstrip(os.sep), os.getpid())
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, "X.npy"), np.ascontiguousarray(X, dtype=np.float64))
+    _finish_store(tmp, directory, Y, sub_to_main_type, feature_order)
+
+
+def save_columns(directory, n_rows, columns, Y, sub_to_main_type):
+    """
+    Same as save_store, but X is written one column at a time into a memory-mapped file, so only one column has to
+    be in memory at once.
+
+    Parameters
+    ----------
+    directory:
+        path of the store.
+    n_rows: `int`
+        number of rows.
+    columns: `dict`
+        feature name -> function returning the values of the column (a numpy array of length n_rows). Columns are
+        stored sorted by name, as init does.
+    Y:
+        numpy array for class labels.
+    sub_to_main_type:
+        dict mapping network sub-type to network type.
+
+    """
+    tmp = "%s.%d.tmp" % (directory.rstrip(os.sep), os.getpid())
+    os.makedirs(tmp)
+    feature_order = sorted(columns)
+    X = np.lib.format.open_memmap(os.path.join(tmp, "X.npy"), mode='w+', dtype=np.float64,
+                                  shape=(n_rows, len(feature_order)))
+    for j, name in enumerate(feature_order):
+        X[:, j] = columns[name]()
+    X.flush()
+    del X
+    _finish_store(tmp, directory, Y, sub_to_main_type, feature_order)
+
+
+def _finish_store(tmp, directory, Y, sub_to_main_type, feature_order):
+    Y = np.asarray(Y)
+    classes, codes = np.unique(Y, return_inverse=True)
+
+    np.save(os.path.join(tmp, "Y.npy"), Y.astype(str))
+    np.save(os.path.join(tmp, "y_codes.npy"), codes.astype(np.int32))
+    np.savez(os.path.join(tmp, "meta.npz"),
+             classes=classes.astype(str),
+             feature_order=np.array(feature_order, dtype=str),
+             sub_types=np.array(list(sub_to_main_type.keys()), dtype=str),
+             main_types=np.array(list(sub_to_main_type.values()), dtype=str))
+
+    try:
+        os.rename(tmp, directory)
+    except OSError:
+        # another process has written the same store in the meantime.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_store(directory, mmap_mode='r'):
+    """
+    Load a store written by save_store. X and Y are memory-mapped read-only by default, so processes loading the
+    same store share its pages.
+
+    Returns
+    -------
+    The same (X, Y, sub_to_main_type, feature_order) as init.
+
+    """
+    X = np.load(os.path.join(directory, "X.npy"), mmap_mode=mmap_mode)
+    Y = np.load(os.path.join(directory, "Y.npy"), mmap_mode=mmap_mode)
+    with np.load(os.path.join(directory, "meta.npz")) as meta:
+        feature_order = meta["feature_order"].tolist()
+        sub_to_main_type = dict(zip(meta["sub_types"].tolist(), meta["main_types"].tolist()))
+    return X, Y, sub_to_main_type, feature_order
+
+
+def load_codes(directory, mmap_mode='r'):
+    """
+    Load the encoded labels of a store: integer codes for every row and the class names they index.
+    """
+    codes = np.load(os.path.join(directory, "y_codes.npy"), mmap_mode=mmap_mode)
+    with np.load(os.path.join(directory, "meta.npz")) as meta:
+        classes = meta["classes"]
+    return codes, classes
+
+
+def store_path(filepath, column_names, isSubType, at_least, cache_dir=None, **kwargs):
+    """
+    Path of the store for the given arguments of init. The store may not exist yet.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), ".feature_cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    digest = file_digest(filepath, cache_dir)
+    return os.path.join(cache_dir, store_key(digest, column_names, isSubType, at_least, **kwargs))
+
+
+def init_cached(filepath, column_names, isSubType, at_least, cache_dir=None, **kwargs):
+    """
+    Same as init, but the result is cached on disk and memory-mapped on later calls.
+
+    The cache is keyed on the content of the csv file and on the arguments, so editing the file or selecting other
+    columns gives a new store. By default stores live in a .feature_cache directory next to the csv file.
+
+    Parameters
+    ----------
+    cache_dir:
+        directory of the stores.
+    Other parameters are the same as init.
+
+    Returns
+    -------
+    The same (X, Y, sub_to_main_type, feature_order) as init, with X and Y read-only memory-mapped arrays.
+
+    """
+    directory = store_path(filepath, column_names, isSubType, at_least, cache_dir=cache_dir, **kwargs)
+    if not os.path.isdir(directory):
+        save_store(directory, *init(filepath, column_names, isSubType, at_least, **kwargs))
+    return load_store(directory)
@@ -0,0 +1,100 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from parallel import effective_jobs
+from metrics import batched_binary_metrics
+
+
+def accuracy_scorer(classes):
+    """
+    Scorer for permutation_importance: accuracy of the most probable class of every sample.
+
+    Parameters
+    ----------
+    classes:
+        classes of the columns of predict_proba, i.e. the classes_ attribute of the classifier.
+
+    """
+    classes = np.asarray(classes)
+
+    def score(y_true, proba):
+        return (classes[proba.argmax(axis=2)] == y_true).mean(axis=1)
+    return score
+
+
+def auc_scorer(classes, positive=1):
+    """
+    Scorer for permutation_importance: ROC-AUC of the probability of the positive class (see metrics).
+    """
+    columns = np.flatnonzero(np.asarray(classes) == positive)
+
+    def score(y_true, proba):
+        y_score = proba[:, :, columns[0]] if len(columns) else np.zeros(proba.shape[:2])
+        return batched_binary_metrics(y_true == positive, y_score)["auc"]
+    return score
+
+
+def _permuted_scores(model, X_test, y_test, scorer, features, permutations):
+    """
+    Scores of the model on copies of the test set, one per (feature, repeat), in which the column of that feature is
+    shuffled. All the copies go through a single predict_proba call.
+    """
+    n_repeats, n = permutations.shape[1], len(X_test)
+    copies = np.repeat(X_test[None, :, :], len(features) * n_repeats, axis=0)
+    for k, feature in enumerate(features):
+        for r in range(n_repeats):
+            copies[k * n_repeats + r, :, feature] = X_test[permutations[k, r], feature]
+
+    proba = model.predict_proba(copies.reshape(-1, X_test.shape[1])).reshape(len(copies), n, -1)
+    return scorer(np.broadcast_to(y_test, (len(copies), n)), proba).reshape(len(features), n_repeats)
+
+
+def permutation_importance(model, X_test, y_test, scorer, n_repeats=5, random_state=None, n_jobs=1):
+    """
+    Permutation importance of every feature: the mean decrease of the score of a fitted model when the values of the
+    feature are shuffled across the test set.
+
+    Unlike the Gini importance of random forests, it is not biased towards features with many distinct values. The
+    model is not refitted; the shuffled copies of the test set of a group of features are scored with one
+    predict_proba call, and the groups are spread over n_jobs threads (tree predictions release the GIL). The
+    permutations are drawn up front, so the result does not depend on n_jobs.
+
+    Parameters
+    ----------
+    model:
+        a fitted classifier with predict_proba.
+    X_test:
+        numpy array of test features.
+    y_test:
+        numpy array of test labels.
+    scorer:
+        function (y_true, proba) -> scores, where y_true has shape (# of copies, # of samples), proba has shape
+        (# of copies, # of samples, # of classes) and scores has shape (# of copies,); see accuracy_scorer and
+        auc_scorer.
+    n_repeats: `int`
+        number of shuffles of every feature.
+    random_state: `int`
+        seed of the shuffles.
+    n_jobs: `int`
+        number of threads. -1 uses all CPUs.
+
+    Returns
+    -------
+    importances: numpy array
+        importance of every feature, ordered as the columns of X_test.
+
+    """
+    X_test = np.asarray(X_test, dtype=np.float64)
+    y_test = np.asarray(y_test)
+    n_features = X_test.shape[1]
+
+    rng = np.random.default_rng(random_state)
+    permutations = rng.permuted(np.broadcast_to(np.arange(len(X_test)), (n_features, n_repeats, len(X_test))),
+                                axis=2)
+    baseline = scorer(y_test[None, :], model.predict_proba(X_test)[None, :, :])[0]
+
+    groups = [group for group in np.array_split(np.arange(n_features), effective_jobs(n_jobs)) if len(group)]
+    with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+        scores = list(executor.map(
+            lambda group: _permuted_scores(model, X_test, y_test, scorer, group, permutations[group]), groups
+        ))
+    return baseline - np.concatenate(scores).mean(axis=1)
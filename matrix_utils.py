@@ -0,0 +1,113 @@
+import math
+import timeit
+import numpy as np
+
+
+def normalize_rows(cm):
+    """
+    Normalize a (confusion) matrix by row. Rows summing up to 0 become all 0.0 instead of NaN.
+    """
+    cm = np.asarray(cm, dtype=np.float64)
+    row_sums = cm.sum(axis=1, keepdims=True)
+    return np.divide(cm, row_sums, out=np.zeros_like(cm), where=row_sums != 0)
+
+
+def nan_to_zero(matrix):
+    """
+    Copy of a matrix with NaNs replaced by 0.0.
+    """
+    matrix = np.array(matrix, dtype=np.float64)
+    matrix[np.isnan(matrix)] = 0.0
+    return matrix
+
+
+def symmetrize_max(matrix):
+    """
+    Symmetric matrix whose (i, j) and (j, i) entries are the larger of the two, with 0 on the diagonal.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    symmetric = np.maximum(matrix, matrix.T)
+    np.fill_diagonal(symmetric, 0)
+    return symmetric
+
+
+def to_distance(similarity):
+    """
+    Turn similarities in [0, 1] into distances in [0, 100]. The diagonal is left as it is.
+    """
+    similarity = np.asarray(similarity, dtype=np.float64)
+    distance = (1 - similarity) * 100
+    np.fill_diagonal(distance, np.diagonal(similarity))
+    return distance
+
+
+def zero_mask(matrix):
+    """
+    Mask (1 for True) of the entries of a matrix that are 0.
+    """
+    return (np.asarray(matrix) == 0).astype(np.float64)
+
+
+def benchmark(sizes=(22, 100, 500), number=3):
+    """
+    Time the vectorized functions against the loops they replace in multi_run and plot, and check that both give
+    the same matrices.
+    """
+
+    def loop_normalize(cm):
+        with np.errstate(invalid='ignore'):
+            cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+        return list(map(lambda ax: list(map(lambda val: 0.0 if math.isnan(val) else val, ax)), cm_normalized))
+
+    def loop_symmetrize(m):
+        N = len(m)
+        for i in range(N):
+            for j in range(N):
+                if i == j:
+                    m[i][j] = 0
+                else:
+                    maximum = max([m[i][j], m[j][i]])
+                    m[i][j] = maximum
+                    m[j][i] = maximum
+        return m
+
+    def loop_distance(m):
+        N = len(m)
+        for i in range(N):
+            for j in range(N):
+                if i == j: continue
+                m[i][j] = (1 - m[i][j]) * 100
+        return m
+
+    def loop_mask(matrix):
+        matrix = np.array(matrix)
+        z = np.zeros(matrix.shape)
+        for i, row in enumerate(matrix):
+            for j, e_ij in enumerate(row):
+                if e_ij == 0:
+                    z[i][j] = 1
+        return z
+
+    def loop_pipeline(cm):
+        m = loop_normalize(cm)
+        return loop_mask(m), np.asarray(loop_distance(loop_symmetrize(m)))
+
+    def vectorized_pipeline(cm):
+        m = normalize_rows(cm)
+        return zero_mask(m), to_distance(symmetrize_max(m))
+
+    rng = np.random.RandomState(0)
+    for n in sizes:
+        cm = rng.poisson(0.5, size=(n, n)) * rng.randint(0, 2, size=(n, 1))
+        expected = loop_pipeline(cm)
+        result = vectorized_pipeline(cm)
+        assert all(np.allclose(e, r) for e, r in zip(expected, result))
+
+        loop_time = timeit.timeit(lambda: loop_pipeline(cm), number=number) / number
+        vectorized_time = timeit.timeit(lambda: vectorized_pipeline(cm), number=number) / number
+        print("%4d classes: loops %.5fs, vectorized %.5fs (x%.0f)"
+              % (n, loop_time, vectorized_time, loop_time / vectorized_time))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+def positive_scores(classifier, X):
+    """
+    Probability of class 1 for every row of X, from a single predict_proba call of a fitted binary classifier.
+    """
+    proba = classifier.predict_proba(X)
+    column = np.flatnonzero(classifier.classes_ == 1)
+    return proba[:, column[0]] if len(column) else np.zeros(len(proba))
+
+
+def _groups(sorted_scores):
+    """
+    For every position of rows of sorted scores, the first and the last position holding the same score.
+    """
+    n = sorted_scores.shape[1]
+    positions = np.broadcast_to(np.arange(n), sorted_scores.shape)
+    changes = sorted_scores[:, 1:] != sorted_scores[:, :-1]
+    starts = np.concatenate((np.ones((len(sorted_scores), 1), dtype=bool), changes), axis=1)
+    ends = np.concatenate((changes, np.ones((len(sorted_scores), 1), dtype=bool)), axis=1)
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, positions, n)[:, ::-1], axis=1)[:, ::-1]
+    return first, last
+
+
+def batched_binary_metrics(y_true, y_score, sample_weight=None, threshold=0.5):
+    """
+    Accuracy, ROC-AUC, PR-AUC (average precision) and confusion matrix of many binary predictions at once.
+
+    Row r of the inputs holds the test labels and positive-class scores of run r, e.g. of every iteration of
+    many_classifications. Every metric is computed with a single sort of the scores along the rows: ROC-AUC is the
+    Mann-Whitney statistic (ties count half) and average precision sums the precision at the threshold of every
+    positive, as in scikit-learn.
+
+    Parameters
+    ----------
+    y_true:
+        array of shape (# of runs, # of samples) of 0/1 labels.
+    y_score:
+        array of the same shape of scores for class 1, e.g. from positive_scores.
+    sample_weight:
+        array of the same shape of sample weights, or `None`.
+    threshold:
+        samples with a score above threshold are predicted as class 1, as predict does for probabilities.
+
+    Returns
+    -------
+    metrics: `dict`
+        "accuracy", "auc" and "pr_auc": arrays of shape (# of runs,); "confusion_matrix": array of shape
+        (# of runs, 2, 2) with true classes in rows.
+
+    """
+    y_true = np.atleast_2d(np.asarray(y_true)).astype(bool)
+    y_score = np.atleast_2d(np.asarray(y_score, dtype=np.float64))
+    weight = np.ones(y_true.shape) if sample_weight is None else np.atleast_2d(np.asarray(sample_weight, dtype=float))
+    rows = np.arange(len(y_true))[:, None]
+
+    y_pred = y_score > threshold
+    cells = 2 * y_true + y_pred
+    confusion = np.stack([(weight * (cells == c)).sum(axis=1) for c in range(4)], axis=1).reshape(-1, 2, 2)
+    accuracy = (confusion[:, 0, 0] + confusion[:, 1, 1]) / weight.sum(axis=1)
+
+    positive_weight = np.where(y_true, weight, 0.0)
+    negative_weight = np.where(y_true, 0.0, weight)
+    n_pos, n_neg = positive_weight.sum(axis=1), negative_weight.sum(axis=1)
+
+    # ROC-AUC: for every positive, the weight of the negatives scored below it, plus half of those tied with it.
+    order = np.argsort(y_score, axis=1, kind="stable")
+    first, last = _groups(y_score[rows, order])
+    negatives_up_to = np.cumsum(negative_weight[rows, order], axis=1)
+    below = np.where(first > 0, negatives_up_to[rows, np.maximum(first - 1, 0)], 0.0)
+    tied = negatives_up_to[rows, last] - below
+    with np.errstate(invalid='ignore', divide='ignore'):
+        auc = (positive_weight[rows, order] * (below + 0.5 * tied)).sum(axis=1) / (n_pos * n_neg)
+
+    # average precision: precision at the threshold of every positive, thresholds taken from the highest score.
+    order = order[:, ::-1]
+    first, last = _groups(-y_score[rows, order])
+    true_positives = np.cumsum(positive_weight[rows, order], axis=1)
+    predicted = np.cumsum(weight[rows, order], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = true_positives[rows, last] / predicted[rows, last]
+        pr_auc = (positive_weight[rows, order] * precision).sum(axis=1) / n_pos
+
+    return {"accuracy": accuracy, "auc": auc, "pr_auc": pr_auc, "confusion_matrix": confusion}
+
+
+def binary_metrics(y_true, y_score, sample_weight=None, threshold=0.5):
+    """
+    Accuracy, ROC-AUC, PR-AUC and confusion matrix of one binary prediction; see batched_binary_metrics.
+    """
+    metrics = batched_binary_metrics(y_true, y_score, sample_weight=sample_weight, threshold=threshold)
+    return dict((name, values[0]) for name, values in metrics.items())
@@ -0,0 +1,207 @@
+import numpy as np
+import scipy.sparse as sp
+from path_features import parse_method
+
+
+# the six connected 4-node graphlets, in the order of the m4_1 ... m4_6 columns.
+GRAPHLETS = ("star", "path", "tailed_triangle", "cycle", "diamond", "clique")
+
+# NON_INDUCED[i, j]: number of copies of graphlet i (as a subgraph, not necessarily induced) in graphlet j.
+NON_INDUCED = np.array([
+    [1, 0, 1, 0, 2, 4],
+    [0, 1, 2, 4, 6, 12],
+    [0, 0, 1, 0, 4, 12],
+    [0, 0, 0, 1, 1, 3],
+    [0, 0, 0, 0, 1, 6],
+    [0, 0, 0, 0, 0, 1],
+], dtype=np.float64)
+
+
+def adjacency(G):
+    """
+    Sparse (CSR) adjacency matrix of a simple undirected igraph.Graph.
+    """
+    n = G.vcount()
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    rows = np.concatenate((edges[:, 0], edges[:, 1]))
+    cols = np.concatenate((edges[:, 1], edges[:, 0]))
+    A = sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(n, n))
+    A.data[:] = 1
+    A.setdiag(0)
+    A.eliminate_zeros()
+    return A
+
+
+def _edges(A):
+    """
+    Both ends of every edge (u < v) of a symmetric adjacency matrix.
+    """
+    upper = sp.triu(A, k=1).tocoo()
+    return upper.row.astype(np.int64), upper.col.astype(np.int64)
+
+
+def _edge_terms(A, degrees, us, vs):
+    """
+    Per-edge quantities for a batch of edges (u, v):
+
+    t: number of triangles on the edge.
+    paw: sum over the triangles (u, v, w) on the edge of (d_u + d_v + d_w - 6) / 3, i.e. the edge's share of
+        tailed triangles.
+    cycle: number of 4-cycles through the edge.
+    clique: number of edges among the common neighbours of u and v, i.e. the number of 4-cliques on the edge.
+    """
+    Ru, Rv = A[us], A[vs]
+    common = Ru.multiply(Rv).tocsr()
+    t = np.asarray(common.sum(axis=1)).ravel()
+    paw = (t * (degrees[us] + degrees[vs] - 6) + common.dot(degrees)) / 3.0
+    clique = np.asarray(common.dot(A).multiply(common).sum(axis=1)).ravel() / 2.0
+
+    k = len(us)
+    Eu = sp.csr_matrix((np.ones(k, dtype=np.int64), (np.arange(k), us)), shape=Ru.shape)
+    Ev = sp.csr_matrix((np.ones(k, dtype=np.int64), (np.arange(k), vs)), shape=Ru.shape)
+    cycle = np.asarray((Ru - Ev).dot(A).multiply(Rv - Eu).sum(axis=1)).ravel()
+    return t, paw, cycle, clique
+
+
+def subgraph_counts(A, batch_size=100000):
+    """
+    Exact numbers of (not necessarily induced) copies of the six connected 4-node graphlets, from degrees,
+    triangles and sparse matrix products.
+
+    Parameters
+    ----------
+    A:
+        sparse symmetric 0/1 adjacency matrix without self-loops.
+    batch_size: `int`
+        number of edges processed at a time, bounding the memory used by 4-clique counting.
+
+    Returns
+    -------
+    counts: numpy array
+        counts of star, path, tailed triangle, cycle, diamond and clique.
+
+    """
+    A = sp.csr_matrix(A, dtype=np.int64)
+    if A.nnz == 0:
+        # no edge, hence no connected graphlet.
+        return np.zeros(6)
+    degrees = np.asarray(A.sum(axis=1)).ravel().astype(np.float64)
+    us, vs = _edges(A)
+
+    # common neighbours of every pair of vertices; the diagonal holds the degrees.
+    A2 = A.dot(A).tocsr()
+    triangles_on_edge = np.asarray(A2[us, vs]).ravel().astype(np.float64)
+    triangles_at_vertex = np.asarray(A2.multiply(A).sum(axis=1)).ravel() / 2.0
+    n_triangles = triangles_on_edge.sum() / 3.0
+
+    pairs = sp.triu(A2, k=1).data.astype(np.float64)
+
+    star = (degrees * (degrees - 1) * (degrees - 2)).sum() / 6.0
+    path = ((degrees[us] - 1) * (degrees[vs] - 1)).sum() - 3 * n_triangles
+    paw = (triangles_at_vertex * (degrees - 2)).sum()
+    cycle = (pairs * (pairs - 1) / 2.0).sum() / 2.0
+    diamond = (triangles_on_edge * (triangles_on_edge - 1) / 2.0).sum()
+
+    # 4-cliques: orient every edge towards the vertex of higher (degree, index), so that every clique is counted once
+    # from its lowest edge, and count the oriented edges among the common out-neighbours of every oriented edge.
+    rank = np.empty(len(degrees), dtype=np.int64)
+    rank[np.lexsort((np.arange(len(degrees)), degrees))] = np.arange(len(degrees))
+    coo = A.tocoo()
+    forward = rank[coo.row] < rank[coo.col]
+    D = sp.csr_matrix((coo.data[forward], (coo.row[forward], coo.col[forward])), shape=A.shape)
+    Du, Dv = D.nonzero()
+    clique = 0.0
+    for begin in range(0, len(Du), batch_size):
+        common = D[Du[begin:begin + batch_size]].multiply(D[Dv[begin:begin + batch_size]]).tocsr()
+        clique += common.dot(D).multiply(common).sum()
+
+    return np.array([star, path, paw, cycle, diamond, clique], dtype=np.float64)
+
+
+def sampled_subgraph_counts(A, k=None, fraction=None, seed=0, batch_size=10000):
+    """
+    Estimate the numbers of (not necessarily induced) copies of the six connected 4-node graphlets from a uniform
+    sample of edges.
+
+    Stars and paths only depend on degrees and triangles; triangles, tailed triangles, cycles, diamonds and cliques
+    are counted on the sampled edges and scaled by # of edges / # of sampled edges, which is unbiased.
+
+    Parameters
+    ----------
+    A:
+        sparse symmetric 0/1 adjacency matrix without self-loops.
+    k: `int`
+        number of sampled edges.
+    fraction: `float`
+        fraction of sampled edges, if k is not given.
+    seed: `int`
+        seed of the edge sample.
+    batch_size: `int`
+        number of sampled edges processed at a time.
+
+    Returns
+    -------
+    counts: numpy array
+        estimated counts of star, path, tailed triangle, cycle, diamond and clique.
+    k: `int`
+        number of sampled edges.
+
+    """
+    A = sp.csr_matrix(A, dtype=np.int64)
+    degrees = np.asarray(A.sum(axis=1)).ravel().astype(np.float64)
+    us, vs = _edges(A)
+    m = len(us)
+    if k is None:
+        k = int(np.ceil((fraction if fraction is not None else 0.1) * m))
+    k = min(k, m)
+
+    sample = np.random.RandomState(seed).choice(m, k, replace=False)
+    totals = np.zeros(5)
+    for begin in range(0, k, batch_size):
+        batch = sample[begin:begin + batch_size]
+        t, paw, cycle, clique = _edge_terms(A, degrees, us[batch], vs[batch])
+        totals += [t.sum(), (t * (t - 1) / 2.0).sum(), paw.sum(), cycle.sum(), clique.sum()]
+
+    t, diamond, paw, cycle, clique = totals * (m / float(k)) if k else totals
+    star = (degrees * (degrees - 1) * (degrees - 2)).sum() / 6.0
+    path = ((degrees[us] - 1) * (degrees[vs] - 1)).sum() - t
+    return np.array([star, path, paw, cycle / 4.0, diamond, clique / 6.0]), k
+
+
+def induced_counts(counts):
+    """
+    Numbers of induced copies of the six connected 4-node graphlets from the numbers of their (not necessarily
+    induced) copies, by solving the triangular system NON_INDUCED.
+    """
+    return np.linalg.solve(NON_INDUCED, np.asarray(counts, dtype=np.float64))
+
+
+def motif_counts(G, method="exact"):
+    """
+    Numbers of the six connected 4-node graphlets of an undirected graph, in the order of the m4_1 ... m4_6 columns
+    of features.csv (star, path, tailed triangle, cycle, diamond and clique).
+
+    Parameters
+    ----------
+    G: `igraph.Graph`
+        a simple undirected graph.
+    method: `str`
+        "exact", or "edges,k=100000,seed=0" / "edges,fraction=0.01,seed=0" to estimate the counts from a sample of
+        edges.
+
+    Returns
+    -------
+    counts: `list`
+        six floats.
+    record: `str`
+        the estimator actually used.
+
+    """
+    name, params = parse_method(method, names=("exact", "edges"))
+    A = adjacency(G)
+    if name == "exact":
+        return induced_counts(subgraph_counts(A)).round().tolist(), "exact"
+
+    counts, k = sampled_subgraph_counts(A, k=params.get("k"), fraction=params.get("fraction"),
+                                        seed=params.get("seed", 0))
+    return induced_counts(counts).tolist(), "edges,k=%d,seed=%d" % (k, params.get("seed", 0))
@@ -1,7 +1,16 @@
+import os
 import math
 import numpy as np
-from preprocess import init
-from multiclass import multiclass_classification
+from collections import OrderedDict
+from feature_store import init_cached
+from multiclass import multiclass_sweep
+from resampling import SAMPLING_METHODS
+from community_detection import detect_communities, METHODS as COMMUNITY_METHODS
+from parallel import parallel_map, spawn_seeds
+from shared import broadcast, attach
+from checkpoint import CheckpointLog, stored_config
+from aggregate import RunAggregator
+from matrix_utils import normalize_rows, symmetrize_max, to_distance
 from plot import plot_confusion_matrix
 from plot import plot_feature_importance
 from plot import index_to_color
@@ -17,44 +26,190 @@ import click
 colors_domain = ["#ff0000", "#9c8110", "#00d404", "#00a4d4", "#1d00d4", "#a400c3", "#831e1e"]
 
 
-def sum_confusion_matrix(X, Y, sub_to_main_type, feature_order, isSubType, samplingMethod, N):
-    accum_matrix, NetworkTypeLabels, accum_acc, feature_importances = \
-        multiclass_classification(X, Y, sub_to_main_type, feature_order, isSubType, samplingMethod)
+# data shared by all the runs of sum_confusion_matrix, attached once per worker process.
+_shared = {}
 
-    list_important_features = [feature_importances]
 
-    for i in range(N - 1):
-        print("i: ", i)
-        cm, _, accuracy, feature_importances = multiclass_classification(X, Y, sub_to_main_type, feature_order,
-                                                                         isSubType, samplingMethod)
-        accum_matrix += cm
-        accum_acc += accuracy
-        list_important_features.append(feature_importances)
-    return accum_matrix, NetworkTypeLabels, accum_acc, list_important_features
+def _install(handles, sub_to_main_type, feature_order, isSubType, samplingMethods, n_splits, permutation_repeats=0,
+             permutation_jobs=1):
+    _shared.clear()
+    _shared.update(attach(handles))
+    _shared.update(sub_to_main_type=sub_to_main_type, feature_order=feature_order, isSubType=isSubType,
+                   samplingMethods=samplingMethods, n_splits=n_splits, permutation_repeats=permutation_repeats,
+                   permutation_jobs=permutation_jobs)
 
 
-def make_symmetric(cm):
-    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
-    cm_normalized_filtered = list(map(lambda ax: list(map(lambda val: 0.0 if math.isnan(val) else val, ax)), cm_normalized))
-    N = len(cm_normalized_filtered)
-
-    # make cm symmetric
-    for i in range(N):
-        for j in range(N):
-            if i == j:
-                cm_normalized_filtered[i][j] = 0
+def _single_run(seed):
+    return multiclass_sweep(_shared["X"], _shared["Y"], _shared["sub_to_main_type"], _shared["feature_order"],
+                            _shared["isSubType"], _shared["samplingMethods"], random_state=seed,
+                            n_splits=_shared["n_splits"], permutation_repeats=_shared["permutation_repeats"],
+                            permutation_jobs=_shared["permutation_jobs"])
+
+
+def _run_record(run, feature_order, permutation_repeats):
+    """
+    Compact result of a run of multiclass_classification: its confusion matrix, labels, accuracy and the importance
+    of every feature of feature_order.
+    """
+    cm, NetworkTypeLabels, accuracy, feature_importances = run[:4]
+    record = {"cm": cm, "labels": list(NetworkTypeLabels), "accuracy": accuracy,
+              "importances": _importance_vector(feature_importances, feature_order)}
+    if permutation_repeats:
+        record["permutation"] = _importance_vector(run[4], feature_order)
+    return record
+
+
+def _importance_vector(ranking, feature_order):
+    importance = dict((name, value) for value, name in ranking)
+    return np.array([importance[name] for name in feature_order])
+
+
+def sum_confusion_matrix(X, Y, sub_to_main_type, feature_order, isSubType, samplingMethod, N, n_jobs=1, seed=None,
+                         n_splits=3, permutation_repeats=0, permutation_jobs=1, checkpoint=None):
+    """
+    Run multiclass_classification N times and sum up the outputs, for one sampling method or for several of them
+    on the same splits (see multiclass.multiclass_sweep).
+
+    Every run gets its own seed derived from the master seed, and the runs are reduced in the order of their seeds,
+    so the result for a given seed is the same whatever the number of workers. X and Y are broadcast to the workers
+    once (see shared.broadcast); every task only carries the seed of its run.
+
+    With a checkpoint, the result of every run is appended to a log as soon as it ends (see
+    checkpoint.CheckpointLog). Calling again with the same log replays the runs in it and only does the missing
+    ones, so an interrupted experiment loses at most the runs in progress, and the result is the same as that of an
+    uninterrupted one.
+
+    Parameters
+    ----------
+    samplingMethod:
+        name of the sampling method, or a list of names to compare.
+    N: `int`
+        number of runs.
+    n_jobs: `int`
+        number of worker processes the runs are spread over. -1 uses all CPUs.
+    seed: `int`
+        master seed. If `None`, the runs are not reproducible, unless a checkpoint is given: the seed is then drawn
+        once and kept in the log.
+    n_splits: `int`
+        number of training/test splits every run trains and scores on.
+    permutation_repeats: `int`
+        if positive, the permutation importance of the features is computed with the fitted forests of every run,
+        with this number of shuffles of every feature.
+    permutation_jobs: `int`
+        number of threads computing permutation importance in every run.
+    checkpoint: `str`
+        path of the checkpoint log, or `None`.
+
+    Returns
+    -------
+    stats: `RunAggregator`
+        confusion_matrix is the sum of the confusion matrices over all the runs and splits, and labels are its rows
+        and columns. The "accuracy" metric holds the accuracy of every run, averaged over its splits, and
+        rank_frequency (and permutation_frequency) the rankings of feature importance. If samplingMethod is a list,
+        an OrderedDict mapping every method to its RunAggregator.
+
+    """
+    sweep = not isinstance(samplingMethod, str)
+    methods = list(samplingMethod) if sweep else [samplingMethod]
+
+    log = None
+    if checkpoint is not None:
+        if seed is None:
+            seed = (stored_config(checkpoint) or {}).get("seed")
+            if seed is None:
+                seed = np.random.SeedSequence().entropy
+        log = CheckpointLog(checkpoint, {"seed": seed, "features": feature_order, "instances": len(Y),
+                                         "isSubType": isSubType, "samplingMethod": samplingMethod,
+                                         "n_splits": n_splits, "permutation_repeats": permutation_repeats})
+    seeds = spawn_seeds(seed, N)
+    missing = range(N) if log is None else log.missing(N)
+
+    stats = OrderedDict((method, RunAggregator(feature_order)) for method in methods)
+    with broadcast({"X": X, "Y": np.asarray(Y)}, n_jobs=n_jobs) as handles:
+        runs = parallel_map(_single_run, [seeds[i] for i in missing], n_jobs=n_jobs, initializer=_install,
+                            initargs=(handles, sub_to_main_type, feature_order, isSubType, methods, n_splits,
+                                      permutation_repeats, permutation_jobs))
+
+        # missing runs come in increasing order, interleaved with the logged ones.
+        for i in range(N):
+            if log is not None and i in log.records:
+                entry = log.records[i]
+                records = entry["methods"] if sweep else {methods[0]: entry}
             else:
-                maximum = max([cm_normalized_filtered[i][j], cm_normalized_filtered[j][i]])
-                cm_normalized_filtered[i][j] = maximum
-                cm_normalized_filtered[j][i] = maximum
+                print("i: ", i)
+                outputs = next(runs)
+                records = OrderedDict((method, _run_record(outputs[method], feature_order, permutation_repeats))
+                                      for method in methods)
+                if log is not None and sweep:
+                    log.append(i, seed=seeds[i], methods=records)
+                elif log is not None:
+                    log.append(i, seed=seeds[i], **records[methods[0]])
+
+            for method in methods:
+                record = records[method]
+                stats[method].labels = record["labels"]
+                stats[method].update(
+                    cm=np.asarray(record["cm"]), feature_importances=np.asarray(record["importances"]),
+                    permutation_importances=np.asarray(record["permutation"]) if permutation_repeats else None,
+                    accuracy=record["accuracy"]
+                )
+
+    if log is not None:
+        log.close()
+    return stats if sweep else stats[methods[0]]
+
+
+def write_sweep(stats, N, n_splits, directory=".", community_method="fastgreedy", random_state=None):
+    """
+    Write the outputs of a sweep over sampling methods for overlap_community and graph_draw: labels.txt with the
+    classes, one per line, and for every method, confusion_<method>.txt with the confusion matrix averaged over the
+    runs and splits, and communities_<method>.txt with the community of every class in the graph of
+    make_adj_matrix, one per line in the order of labels.txt (see graph_draw.read_community).
 
-    # make values into distance
-    for i in range(N):
-        for j in range(N):
-            if i == j: continue
-            cm_normalized_filtered[i][j] = (1 - cm_normalized_filtered[i][j]) * 100
+    Parameters
+    ----------
+    stats: `dict`
+        sampling method -> RunAggregator, from sum_confusion_matrix.
+    N: `int`
+        number of runs.
+    n_splits: `int`
+        number of splits in every run.
+    directory: `str`
+        output directory.
+    community_method: `str`
+        community detection algorithm (see community_detection.detect_communities).
+    random_state: `int`
+        seed of the randomized community detection algorithms.
+
+    Returns
+    -------
+    communities: `OrderedDict`
+        sampling method -> numpy array of the community of every class.
+
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
 
-    return np.asarray(cm_normalized_filtered)
+    communities = OrderedDict()
+    for method, aggregator in stats.items():
+        average_matrix = aggregator.confusion_matrix / float(N * n_splits)
+        np.savetxt(os.path.join(directory, "confusion_%s.txt" % method), average_matrix)
+        communities[method] = detect_communities(make_adj_matrix(average_matrix), method=community_method,
+                                                 random_state=random_state)
+        np.savetxt(os.path.join(directory, "communities_%s.txt" % method), communities[method], fmt="%d")
+        labels = aggregator.labels
+
+    with open(os.path.join(directory, "labels.txt"), 'w') as f:
+        f.writelines("%s\n" % label for label in labels)
+    return communities
+
+
+def make_symmetric(cm):
+    """
+    Distance matrix between classes from a confusion matrix: row-normalized, symmetrized with the larger of the two
+    misclassification rates, and turned into (1 - rate) * 100.
+    """
+    return to_distance(symmetrize_max(normalize_rows(cm)))
 
 
 def build_dendrogram(D, leave_name, sub_to_main_type, isSubType):
@@ -130,27 +285,36 @@ def graph_draw(G, NetworkTypeLabels, sub_to_main_type):
 
 
 def make_adj_matrix(cm):
-    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
-    cm_normalized_filtered = list(map(lambda ax: list(map(lambda val: 0.0 if math.isnan(val) else val, ax)), cm_normalized))
-    N = len(cm_normalized_filtered)
-
-    # make cm symmetric
-    for i in range(N):
-        for j in range(N):
-            if i == j:
-                cm_normalized_filtered[i][j] = 0
-            else:
-                maximum = max([cm_normalized_filtered[i][j], cm_normalized_filtered[j][i]])
-                cm_normalized_filtered[i][j] = maximum
-                cm_normalized_filtered[j][i] = maximum
-
-    return np.asarray(cm_normalized_filtered)
+    """
+    Adjacency matrix between classes from a confusion matrix: row-normalized and symmetrized with the larger of the
+    two misclassification rates.
+    """
+    return symmetrize_max(normalize_rows(cm))
 
 
 @click.command()
 @click.option('--csv', nargs=1, type=str, help='CSV data for the features.')
 @click.option('--feature', '-f', multiple=True)
-def main(csv, feature):
+@click.option('--iter', 'N', nargs=1, type=int, default=None,
+              help='Number of runs of multi-class classification (default: 1000 forest fits, i.e. 1000 / --splits '
+                   'runs, rounded up).')
+@click.option('--splits', nargs=1, type=int, default=3, help='Number of training/test splits in every run.')
+@click.option('--jobs', nargs=1, type=int, default=1, help='Number of worker processes (-1 for all CPUs).')
+@click.option('--seed', nargs=1, type=int, default=None, help='Master seed for reproducible runs.')
+@click.option('--permutation', nargs=1, type=int, default=0,
+              help='Number of shuffles per feature for permutation importance (default: 0, Gini importance only).')
+@click.option('--perm-jobs', 'perm_jobs', nargs=1, type=int, default=1,
+              help='Number of threads computing permutation importance in every run.')
+@click.option('--checkpoint', nargs=1, type=str, default=None,
+              help='Log file of the results of the runs, from which an interrupted experiment resumes.')
+@click.option('--sampling', multiple=True, type=click.Choice(SAMPLING_METHODS),
+              help='Sampling method (default: None). With several, they are compared on the same splits.')
+@click.option('--sweep', is_flag=True, default=False, help='Compare all the sampling methods on the same splits.')
+@click.option('--out', nargs=1, type=str, default='.',
+              help='Directory of the confusion matrices and communities of every method of a comparison.')
+@click.option('--communities', nargs=1, type=click.Choice(sorted(COMMUNITY_METHODS)), default='fastgreedy',
+              help='Community detection algorithm of a comparison.')
+def main(csv, feature, N, splits, jobs, seed, permutation, perm_jobs, checkpoint, sampling, sweep, out, communities):
     """
     Draw a bar chart that ranks the importance of feature combinations in order.
 
@@ -160,6 +324,29 @@ def main(csv, feature):
         Path to csv file that contains the features.
     feature: `str`
         Name of the feature(s) for the random forest classifier.
+    N: `int`
+        Number of runs of multi-class classification. By default, as many runs as needed for 1000 forest fits,
+        i.e. ceil(1000 / splits).
+    splits: `int`
+        Number of training/test splits every run trains and scores on.
+    jobs: `int`
+        Number of worker processes the runs are spread over.
+    seed: `int`
+        Master seed from which the seed of every run is derived.
+    permutation: `int`
+        Number of shuffles of every feature for permutation importance, 0 to skip it.
+    perm_jobs: `int`
+        Number of threads computing permutation importance in every run.
+    checkpoint: `str`
+        Path of the log of the results of the runs; runs already in it are not done again.
+    sampling: `str`
+        Name(s) of the sampling method(s).
+    sweep: `bool`
+        Compare all the sampling methods.
+    out: `str`
+        Output directory of a comparison of sampling methods.
+    communities: `str`
+        Community detection algorithm run on the confusion graph of every sampling method.
 
     Returns
     -------
@@ -169,6 +356,10 @@ def main(csv, feature):
     # column_names = ["NetworkType", "SubType", "ClusteringCoefficient", "DegreeAssortativity",
     #                 "m4_1", "m4_2", "m4_3", "m4_4", "m4_5", "m4_6"]
     # features: "sepal_length", "sepal_width", "petal_length", "petal_width"
+    if N is None:
+        # every run fits one forest per split.
+        N = int(math.ceil(1000.0 / splits))
+
     column_names = ["NetworkType", "SubType"]
     column_names += list(feature)
 
@@ -178,22 +369,35 @@ def main(csv, feature):
 
     # at_least is used for filtering out classes whose instance is below this threshold.
     at_least = 0
-    X, Y, sub_to_main_type, feature_order = init(csv_file, column_names, isSubType, at_least)
-
-    # the number of iteration for multi-class classification
-    N = 1000
+    X, Y, sub_to_main_type, feature_order = init_cached(csv_file, column_names, isSubType, at_least)
 
     # Valid methods are: "RandomOver", "RandomUnder", "SMOTE" and "None"
-    sampling_method = "None"
-    print("sampling_method: %s" % sampling_method)
+    sampling_methods = list(SAMPLING_METHODS) if sweep else list(sampling) or ["None"]
     print("Number of instances: %d" % len(Y))
 
-    Matrix, NetworkTypeLabels, sum_accuracy, list_important_features = \
-        sum_confusion_matrix(X, Y, sub_to_main_type, feature_order, isSubType, sampling_method, N)
+    if len(sampling_methods) > 1:
+        stats = sum_confusion_matrix(X, Y, sub_to_main_type, feature_order, isSubType, sampling_methods, N,
+                                     n_jobs=jobs, seed=seed, n_splits=splits, permutation_repeats=permutation,
+                                     permutation_jobs=perm_jobs, checkpoint=checkpoint)
+        memberships = write_sweep(stats, N, splits, directory=out, community_method=communities, random_state=seed)
+        for method, membership in memberships.items():
+            print("%s: average accuracy %f, %d communities" % (method, stats[method].mean("accuracy"),
+                                                               len(set(membership))))
+        return
+
+    sampling_method = sampling_methods[0]
+    print("sampling_method: %s" % sampling_method)
+
+    stats = sum_confusion_matrix(X, Y, sub_to_main_type, feature_order, isSubType, sampling_method, N,
+                                 n_jobs=jobs, seed=seed, n_splits=splits, permutation_repeats=permutation,
+                                 permutation_jobs=perm_jobs, checkpoint=checkpoint)
+    Matrix, NetworkTypeLabels = stats.confusion_matrix, stats.labels
 
-    average_matrix = np.asarray(list(map(lambda row: list(map(lambda e: e / N, row)), Matrix)))
-    print("average accuracy: %f" % (float(sum_accuracy) / float(N)))
-    plot_feature_importance(list_important_features, feature_order)
+    average_matrix = Matrix / float(N * splits)
+    print("average accuracy: %f" % stats.mean("accuracy"))
+    plot_feature_importance(stats.rank_frequency, feature_order)
+    if permutation:
+        plot_feature_importance(stats.permutation_frequency, feature_order, filename="permutation_importance.pdf")
 
     # if not isSubType:
     #     sub_to_main_type = {v: v for v in sub_to_main_type.values()}
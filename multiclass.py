@@ -1,89 +1,157 @@
 from preprocess import *
 import numpy as np
+from collections import OrderedDict
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import StratifiedShuffleSplit
 from sklearn.metrics import confusion_matrix
-from imblearn.over_sampling import SMOTE, RandomOverSampler
-from imblearn.under_sampling import RandomUnderSampler
+from parallel import spawn_seeds
+from importance import permutation_importance, accuracy_scorer
+from resampling import Resampler
 
 
-def multiclass_classification(X, Y, sub_to_main_type, feature_names, isSubType, samplingMethod):
+def resample(X_train, y_train, NetworkTypeLabels, samplingMethod, random_state=None):
     """
-    This function is for multi-class classification with some sampling methods.
+    Balance the classes of a training set with a sampling method.
 
-    :param X: numpy array for features.
-    :param Y: numpy array for class labels.
-    :param sub_to_main_type: dict mapping network sub-type to network type.
-    :param feature_names: a list of feature names.
-    :param isSubType: flag for if labels in Y are network subtypes or not.
+    RandomOver and RandomUnder bring every class to the size of the largest and the smallest class; SMOTE adds
+    synthetic samples to every minority class until it is as large as the largest one (see resampling.Resampler).
+
+    :param X_train: numpy array for features of the training set.
+    :param y_train: numpy array for class labels of the training set.
+    :param NetworkTypeLabels: a list of all the class labels.
     :param samplingMethod: name of the sampling method. Valid names are: RandomOver, RandomUnder, SMOTE and None
+    :param random_state: seed for the sampling method.
     :return:
-     cm: confusion matrix
-     NetworkTypeLabels: a list of string, either network type or network subtype.
-     accuracy: accuracy value taking a value in the range [0-1].
-     feature_importances: a list of tuple of a feature's name and its importance in the classification.
+     sampled_x: numpy array for features of the resampled training set.
+     sampled_y: numpy array for class labels of the resampled training set.
     """
+    return Resampler(X_train, y_train).sample(samplingMethod, random_state=random_state)
 
-    if isSubType:
-        NetworkTypeLabels = sorted(list(set(Y)), key=lambda sub_type: sub_to_main_type[sub_type])
-    else:
-        NetworkTypeLabels = sorted(list(set(Y)))
 
-    sss = StratifiedShuffleSplit(n_splits=3, test_size=0.4, random_state=0)
+def fit_and_evaluate(X_train, y_train, X_test, y_test, NetworkTypeLabels, random_state=None, permutation_repeats=0,
+                     permutation_jobs=1):
+    """
+    Train a random forest and evaluate it on a test set with a single pass of predictions.
 
-    for train_index, test_index in sss.split(X, Y):
-        X_train, X_test = X[train_index], X[test_index]
-        y_train, y_test = Y[train_index], Y[test_index]
+    :param permutation_repeats: number of shuffles of every feature for permutation importance; 0 skips it.
+    :param permutation_jobs: number of threads computing permutation importance.
+    :return:
+     cm: confusion matrix
+     accuracy: accuracy value taking a value in the range [0-1].
+     importances: numpy array of the importance of every feature.
+     permutation_importances: numpy array of the permutation importance (decrease of accuracy) of every feature, or
+      None if permutation_repeats is 0.
+    """
+    random_forest = RandomForestClassifier(random_state=random_state)
+    random_forest.fit(X_train, y_train)
 
-    if samplingMethod == "RandomOver":
-        random_over = RandomOverSampler()
-        sampled_x, sampled_y = random_over.fit_sample(X_train, y_train)
+    y_pred = random_forest.predict(X_test)
+    cm = confusion_matrix(y_test, y_pred, labels=NetworkTypeLabels)
+    accuracy = float(np.mean(y_pred == y_test))
 
-    elif samplingMethod == "RandomUnder":
-        random_under = RandomUnderSampler()
-        sampled_x, sampled_y = random_under.fit_sample(X_train, y_train)
+    permutation_importances = None
+    if permutation_repeats:
+        permutation_importances = permutation_importance(
+            random_forest, X_test, y_test, accuracy_scorer(random_forest.classes_), n_repeats=permutation_repeats,
+            random_state=random_state, n_jobs=permutation_jobs
+        )
+    return cm, accuracy, random_forest.feature_importances_, permutation_importances
 
-    # SMOTE does not support multi-class classification in imblearn library, so we populate minority classes
-    # in binary classification setting. The resulting set should all have the same # of instances as the largest class.
-    elif samplingMethod == "SMOTE":
-        sm = SMOTE(kind='regular', k=3)
-        sm.fit(X_train, y_train)
 
-        # get the label of the largest class in terms of the number of instances.
-        majority = sm.maj_c_
+def multiclass_classification(X, Y, sub_to_main_type, feature_names, isSubType, samplingMethod, random_state=None,
+                              n_splits=3, test_size=0.4, return_folds=False, permutation_repeats=0, permutation_jobs=1):
+    """
+    This function is for multi-class classification with some sampling methods.
 
-        all_X = []
-        all_Y = []
+    The data set is split n_splits times into stratified training and test sets, and a random forest is trained and
+    evaluated on every one of them.
 
-        for network_type in NetworkTypeLabels:
-            if network_type != majority:
-                # extract elements of a pair of network types, i.e. the majority and one to be inflated
-                X_extracted = np.concatenate((X_train[y_train == majority], X_train[y_train == network_type]), axis=0)
-                Y_extracted = np.concatenate((y_train[y_train == majority], y_train[y_train == network_type]), axis=0)
-                x_tmp, y_tmp = sm.fit_sample(X_extracted, Y_extracted)
-                x = x_tmp[y_tmp == network_type]
-                y = y_tmp[y_tmp == network_type]
-                all_X.append(x)
-                all_Y.append(y)
+    :param X: numpy array for features.
+    :param Y: numpy array for class labels.
+    :param sub_to_main_type: dict mapping network sub-type to network type.
+    :param feature_names: a list of feature names.
+    :param isSubType: flag for if labels in Y are network subtypes or not.
+    :param samplingMethod: name of the sampling method. Valid names are: RandomOver, RandomUnder, SMOTE and None
+    :param random_state: seed for the splits, the sampling method and the random forests. Runs with the same seed give
+     the same result.
+    :param n_splits: number of training/test splits (folds).
+    :param test_size: proportion of the data set in the test set of every split.
+    :param return_folds: if True, also return the confusion matrix of every fold.
+    :param permutation_repeats: if positive, also return the permutation importance of the features, with this number
+     of shuffles of every feature.
+    :param permutation_jobs: number of threads computing permutation importance.
+    :return:
+     cm: confusion matrix summed over the folds.
+     NetworkTypeLabels: a list of string, either network type or network subtype.
+     accuracy: accuracy value taking a value in the range [0-1], averaged over the folds.
+     feature_importances: a list of tuple of a feature's name and its importance in the classification, averaged
+      over the folds.
+     permutation_importances: (only if permutation_repeats) same as feature_importances, for permutation
+      importance.
+     fold_cms: (only if return_folds) numpy array of shape (n_splits, # of labels, # of labels).
+    """
 
-        all_X.append(X_train[y_train == majority])
-        all_Y.append(y_train[y_train == majority])
+    return multiclass_sweep(X, Y, sub_to_main_type, feature_names, isSubType, [samplingMethod],
+                            random_state=random_state, n_splits=n_splits, test_size=test_size,
+                            return_folds=return_folds, permutation_repeats=permutation_repeats,
+                            permutation_jobs=permutation_jobs)[samplingMethod]
 
-        Xs = np.concatenate(tuple(all_X))
-        Ys = np.concatenate(tuple(all_Y))
 
-        sampled_x, sampled_y = sm.fit_sample(Xs, Ys)
+def multiclass_sweep(X, Y, sub_to_main_type, feature_names, isSubType, samplingMethods, random_state=None,
+                     n_splits=3, test_size=0.4, return_folds=False, permutation_repeats=0, permutation_jobs=1):
+    """
+    multiclass_classification with several sampling methods on the same splits.
 
-    elif samplingMethod == "None":
-        sampled_x, sampled_y = X_train, y_train
+    Every method is trained on a resampling of the same training set and scored on the same test set, with the same
+    seeds, so the differences between methods are not blurred by different splits. The classes of a training set are
+    indexed once (see resampling.Resampler) for all the methods.
 
-    random_forest = RandomForestClassifier()
-    random_forest.fit(sampled_x, sampled_y)
-    accuracy = random_forest.score(X_test, y_test)
+    :param samplingMethods: a list of names of sampling methods. Valid names are: RandomOver, RandomUnder, SMOTE and
+     None
+    :return: an OrderedDict mapping every sampling method to the outputs of multiclass_classification with it. See
+     multiclass_classification for the other parameters.
+    """
 
-    feature_importances = sorted(zip(map(lambda x: round(x, 4), random_forest.feature_importances_), feature_names),
-                                 reverse=True)
+    if isSubType:
+        NetworkTypeLabels = sorted(set(Y), key=lambda sub_type: (sub_to_main_type[sub_type], sub_type))
+    else:
+        NetworkTypeLabels = sorted(list(set(Y)))
 
-    y_pred = random_forest.predict(X_test)
-    cm = confusion_matrix(y_test, y_pred, labels=NetworkTypeLabels)
-    return cm, NetworkTypeLabels, accuracy, feature_importances
+    seeds = spawn_seeds(random_state, n_splits + 1)
+    sss = StratifiedShuffleSplit(n_splits=n_splits, test_size=test_size, random_state=seeds[0])
+
+    folds = OrderedDict((method, {"cms": [], "accuracies": [], "importances": [], "permutations": []})
+                        for method in samplingMethods)
+    for (train_index, test_index), seed in zip(sss.split(X, Y), seeds[1:]):
+        X_test, y_test = X[test_index], Y[test_index]
+
+        # the resampled training sets are gathered from X directly, without a copy of the training set first.
+        resampler = Resampler(X, Y, index=train_index)
+        for method, fold in folds.items():
+            sampled_x, sampled_y = resampler.sample(method, random_state=seed)
+            cm, accuracy, importance, permutation = fit_and_evaluate(
+                sampled_x, sampled_y, X_test, y_test, NetworkTypeLabels, random_state=seed,
+                permutation_repeats=permutation_repeats, permutation_jobs=permutation_jobs
+            )
+            fold["cms"].append(cm)
+            fold["accuracies"].append(accuracy)
+            fold["importances"].append(importance)
+            fold["permutations"].append(permutation)
+
+    results = OrderedDict()
+    for method, fold in folds.items():
+        fold_cms = np.array(fold["cms"])
+        cm = fold_cms.sum(axis=0)
+        accuracy = float(np.mean(fold["accuracies"]))
+
+        feature_importances = sorted(zip(map(lambda x: round(x, 4), np.mean(fold["importances"], axis=0)),
+                                         feature_names), reverse=True)
+
+        outputs = (cm, NetworkTypeLabels, accuracy, feature_importances)
+        if permutation_repeats:
+            outputs += (sorted(zip(map(lambda x: round(x, 4), np.mean(fold["permutations"], axis=0)), feature_names),
+                               reverse=True),)
+        if return_folds:
+            outputs += (fold_cms,)
+        results[method] = outputs
+    return results
@@ -0,0 +1,232 @@
+import os
+import csv
+import shutil
+import numpy as np
+from collections import OrderedDict
+from feature_extraction import read_graph
+from feature_store import save_columns
+from motifs import adjacency
+import path_features
+
+import click
+
+
+def _degrees(A):
+    return np.diff(A.indptr).astype(np.float64)
+
+
+def onion_layers(A):
+    """
+    Onion decomposition (Hebert-Dufresne, Grochow and Allard): every vertex gets the index of the peeling round of
+    the k-core decomposition in which it is removed (its layer), together with its coreness.
+
+    Vertices of degree at most k are removed all at once in every round; only the neighbours of removed vertices can
+    join the next round, so a round costs O(# of removed edges) and a new core only costs a scan of the degrees.
+
+    Parameters
+    ----------
+    A:
+        sparse (CSR) symmetric 0/1 adjacency matrix without self-loops.
+
+    Returns
+    -------
+    layers: numpy array
+        layer of every vertex, starting from 1.
+    cores: numpy array
+        coreness of every vertex.
+
+    """
+    n = A.shape[0]
+    degrees = np.diff(A.indptr).astype(np.int64)
+    alive = np.ones(n, dtype=bool)
+    layers = np.zeros(n, dtype=np.int64)
+    cores = np.zeros(n, dtype=np.int64)
+    k, layer, n_alive = 0, 0, n
+
+    removed = np.array([], dtype=np.int64)
+    while n_alive:
+        if len(removed) == 0:
+            # the current core is exhausted: move to the next one.
+            k = max(k, degrees[alive].min())
+            removed = np.flatnonzero(alive & (degrees <= k))
+
+        layer += 1
+        layers[removed] = layer
+        cores[removed] = k
+        alive[removed] = False
+        n_alive -= len(removed)
+
+        # neighbours of the removed vertices: concatenation of their rows of A.
+        starts, counts = A.indptr[removed], np.diff(A.indptr)[removed]
+        offsets = np.cumsum(counts) - counts
+        neighbours = A.indices[np.repeat(starts - offsets, counts) + np.arange(counts.sum())]
+        degrees -= np.bincount(neighbours, minlength=n)
+
+        candidates = np.unique(neighbours)
+        removed = candidates[alive[candidates] & (degrees[candidates] <= k)]
+
+    return layers, cores
+
+
+# node feature name in nodes.csv -> function(G, A, method) computing it for every vertex. method is the estimator
+# of the path-based features (see path_features.parse_method) and is ignored by the others.
+NODE_FEATURES = OrderedDict([
+    ("degree", lambda G, A, method: _degrees(A)),
+    ("betweenness", lambda G, A, method: path_features.betweenness(G, method)[0]),
+    ("closeness", lambda G, A, method: path_features.closeness(G, method)[0]),
+    ("eigencentrality", lambda G, A, method: np.array(G.eigenvector_centrality(scale=True))),
+    ("coreness", lambda G, A, method: np.array(G.coreness(), dtype=np.float64)),
+    ("layerness", lambda G, A, method: onion_layers(A)[0].astype(np.float64)),
+    ("pagerank", lambda G, A, method: np.array(G.pagerank(directed=False))),
+    ("sum_friends_friends", lambda G, A, method: A.dot(_degrees(A))),
+    ("transitivity", lambda G, A, method: np.array(G.transitivity_local_undirected(mode="zero"))),
+])
+
+
+def _name(value):
+    # igraph reads numeric GML attributes as floats: integral values are named as integers ("3", not "3.0").
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def node_names(G):
+    """
+    Names of the vertices of a graph read by read_graph: edge-list names, GML labels or ids, or indices. Integral
+    numbers are written without a decimal part, so GML ids read as floats are named "0", "1", ...
+    """
+    for attribute in ("name", "label", "id"):
+        if attribute in G.vs.attributes():
+            return np.array([_name(v) for v in G.vs[attribute]])
+    return np.arange(G.vcount()).astype(str)
+
+
+def node_labels(names, seeds):
+    """
+    SubType of every vertex: "seed" for the vertices named in seeds and "non-seed" for the others.
+    """
+    return np.where(np.isin(names, np.asarray(sorted(seeds), dtype=str)), "seed", "non-seed")
+
+
+def _columns(G, features, approx):
+    A = adjacency(G)
+    return OrderedDict((name, (lambda name=name: NODE_FEATURES[name](G, A, (approx or {}).get(name, "exact"))))
+                       for name in features)
+
+
+def write_csv(output, network, names, labels, columns, chunk_size=100000):
+    """
+    Write node features to a csv file in the format of nodes.csv, chunk_size rows at a time.
+
+    Every row is keyed by "<network>:<vertex name>" in the .gmlFile column, with the network as NetworkType and
+    the label of the vertex as SubType.
+
+    Parameters
+    ----------
+    output:
+        path of the csv file.
+    network: `str`
+        name of the network.
+    names:
+        numpy array of vertex names.
+    labels:
+        numpy array of vertex labels.
+    columns: `dict`
+        feature name -> numpy array of values for every vertex.
+    chunk_size: `int`
+        number of rows formatted and written at a time.
+
+    """
+    features = list(columns)
+    with open(output, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([".gmlFile", "NetworkType", "SubType"] + features)
+        for begin in range(0, len(names), chunk_size):
+            end = begin + chunk_size
+            keys = np.char.add(network + ":", names[begin:end])
+            values = [np.asarray(columns[name][begin:end]).astype(str) for name in features]
+            writer.writerows(zip(keys, [network] * len(keys), labels[begin:end], *values))
+
+
+def generate_node_features(graph_path, output, features, seeds=(), approx=None, chunk_size=100000):
+    """
+    Compute node features of a network and write them to output.
+
+    Features are computed one at a time with igraph routines and sparse matrix products, and only one of them is in
+    memory at once. If output ends with .csv, the features go through a temporary memory-mapped file and a csv file
+    in the format of nodes.csv is written from it in chunks; otherwise output is a feature store directory (see
+    feature_store.save_columns), filled one column at a time, which load_store memory-maps.
+
+    Parameters
+    ----------
+    graph_path:
+        path to a GML or edge-list file.
+    output:
+        path of the csv file or store directory to write.
+    features:
+        names of node features, keys of NODE_FEATURES.
+    seeds:
+        names of the seed vertices.
+    approx: `dict`
+        feature name -> estimator for betweenness and closeness, e.g. {"betweenness": "pivots,k=1000,seed=0"}.
+    chunk_size: `int`
+        number of csv rows written at a time.
+
+    Returns
+    -------
+    n_nodes: `int`
+        number of rows written.
+
+    """
+    unknown = [name for name in features if name not in NODE_FEATURES]
+    if unknown:
+        raise ValueError("unknown node features: %s" % ", ".join(unknown))
+
+    G = read_graph(graph_path)
+    network = os.path.splitext(os.path.basename(graph_path))[0]
+    names = node_names(G)
+    labels = node_labels(names, seeds)
+    columns = _columns(G, features, approx)
+
+    if output.lower().endswith(".csv"):
+        # the columns are computed one at a time into a memory-mapped file next to output, which the rows are then
+        # written from, so only one column is in memory at once.
+        tmp = "%s.%d.tmp.npy" % (output, os.getpid())
+        X = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64, shape=(G.vcount(), len(columns)))
+        try:
+            for j, compute in enumerate(columns.values()):
+                X[:, j] = compute()
+            write_csv(output, network, names, labels, OrderedDict((name, X[:, j]) for j, name in enumerate(columns)),
+                      chunk_size=chunk_size)
+        finally:
+            del X
+            os.remove(tmp)
+    else:
+        if os.path.isdir(output):
+            shutil.rmtree(output)
+        save_columns(output, G.vcount(), columns, labels, dict((label, network) for label in np.unique(labels)))
+    return G.vcount()
+
+
+@click.command()
+@click.option('--input', 'graph_path', nargs=1, type=str, help='GML or edge-list file.')
+@click.option('--output', nargs=1, type=str, default='nodes.csv',
+              help='CSV file, or directory of a memory-mappable feature store.')
+@click.option('--feature', '-f', multiple=True, help='Node feature to compute (default: all).')
+@click.option('--seeds', nargs=1, type=str, default=None, help='File with the names of the seed nodes, one per line.')
+@click.option('--approx', multiple=True,
+              help='Estimator of betweenness or closeness, e.g. betweenness=pivots,k=1000,seed=0.')
+@click.option('--chunk', nargs=1, type=int, default=100000, help='Number of CSV rows written at a time.')
+def main(graph_path, output, feature, seeds, approx, chunk):
+    features = list(feature) or list(NODE_FEATURES)
+    if seeds:
+        with open(seeds, 'r') as f:
+            seeds = [line.strip() for line in f if line.strip()]
+    approx = dict(spec.split("=", 1) for spec in approx)
+    n_nodes = generate_node_features(graph_path, output, features, seeds=seeds or (), approx=approx,
+                                     chunk_size=chunk)
+    print("%d nodes written to %s" % (n_nodes, output))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,26 @@
+import os
+import csv
+import pickle
+import hashlib
 import numpy as np
-from preprocess import init
+from collections import OrderedDict
+from feature_store import init_cached, load_store
 from plot import plot_feature_importance, plot_2d
+from parallel import spawn_seeds, parallel_map
+from shared import broadcast, attach
+from aggregate import RunAggregator
 from sklearn.model_selection import StratifiedShuffleSplit
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import roc_auc_score
+from metrics import positive_scores, binary_metrics, batched_binary_metrics
+from importance import permutation_importance, auc_scorer
 
 import click
 
 
+# maximum number of rows of the 2D scatter plot of an out-of-core run.
+PLOT_ROWS = 10000
+
+
 def convert_one_to_many(X, Y, label):
     """
     Convert multi-class labels into binary class labels. The argument label corresponds to the label of interest.
@@ -20,22 +33,43 @@ def convert_one_to_many(X, Y, label):
 
     Returns
     -------
+    X as a numpy array, and a numpy array of 1 for the rows of label and 0 for the others.
 
     """
-    X_converted = []
-    Y_converted = []
+    return np.asarray(X), (np.asarray(Y) == label).astype(int)
 
-    for x, y in zip(X, Y):
-        X_converted.append(x)
-        if y == label:
-            Y_converted.append(1)
-        else:
-            Y_converted.append(0)
 
-    return X_converted, Y_converted
+def stratified_splits(Y, N, test_size=0.3, random_state=None):
+    """
+    Generate N independent stratified splits of the data set into training and test sets.
+
+    All the splits are drawn from a single seeded stream and their index arrays are computed up front, so the same
+    random_state always gives the same N splits and the first k of them do not depend on N.
+
+    Parameters
+    ----------
+    Y
+        class labels.
+    N
+        number of splits.
+    test_size
+        proportion of the data set in the test set.
+    random_state
+        seed of the stream of splits.
+
+    Returns
+    -------
+    splits
+        a generator of (train_index, test_index) pairs.
+
+    """
+    sss = StratifiedShuffleSplit(n_splits=N, test_size=test_size, random_state=random_state)
+    splits = list(sss.split(np.zeros(len(Y)), Y))
+    for train_index, test_index in splits:
+        yield train_index, test_index
 
 
-def split_train_test(X, Y):
+def split_train_test(X, Y, random_state=None):
     """
     Split the data set into training and test sets.
 
@@ -43,23 +77,148 @@ def split_train_test(X, Y):
     ----------
     X
     Y
+    random_state
 
     Returns
     -------
 
     """
-    X = np.array(X)
-    Y = np.array(Y)
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+
+    train_index, test_index = next(stratified_splits(Y, 1, random_state=random_state))
+    return X[train_index], X[test_index], Y[train_index], Y[test_index]
+
+
+def score_forest(random_forest, X_test, feature_order):
+    """
+    Run a fitted random forest once over a test set.
+
+    Returns
+    -------
+    feature_importance
+        ranking of the features by Gini importance.
+    y_score
+        probability of class 1 for every test sample.
+
+    """
+    feature_importance = sorted(
+        zip(map(lambda x: round(x, 4), random_forest.feature_importances_), feature_order), reverse=True
+    )
+    return feature_importance, positive_scores(random_forest, X_test)
+
+
+def evaluate_forest(random_forest, X_test, y_test, feature_order, sample_weight=None):
+    """
+    Evaluate a fitted random forest on a test set. Accuracy and AUC both come from a single predict_proba call; the
+    AUC is computed from the predicted probabilities.
+
+    Parameters
+    ----------
+    random_forest
+    X_test
+    y_test
+    feature_order
+    sample_weight
+        weight of every test sample, e.g. inverse sampling probabilities.
+
+    Returns
+    -------
+    accuracy, feature_importance, AUC
+
+    """
+    feature_importance, y_score = score_forest(random_forest, X_test, feature_order)
+    metrics = binary_metrics(y_test, y_score, sample_weight=sample_weight)
+    return metrics["accuracy"], feature_importance, metrics["auc"]
 
-    sss = StratifiedShuffleSplit(n_splits=10000, test_size=0.3, random_state=0)
-    for train_index, test_index in sss.split(X, Y):
-        X_train, X_test = X[train_index], X[test_index]
-        y_train, y_test = Y[train_index], Y[test_index]
 
-    return X_train, X_test, y_train, y_test
+def fit_forest(X_train, y_train, random_state=None, n_estimators=5, sample_weight=None):
+    """
+    Fit the random forest used by all the one-vs-many classifications.
+    """
+    random_forest = RandomForestClassifier(n_estimators=n_estimators, criterion='gini', oob_score=False,
+                                           max_features="log2", random_state=random_state)
+    random_forest.fit(X_train, y_train, sample_weight=sample_weight)
+    return random_forest
+
+
+def update_stats(stats, rankings, y_true, y_score, sample_weight=None, permutations=None):
+    """
+    Add runs to a RunAggregator, with the metrics of all of them computed at once from their stacked test labels
+    and scores (see metrics.batched_binary_metrics). permutations optionally holds the permutation importances of
+    every run.
+    """
+    if not rankings:
+        return stats
+    metrics = batched_binary_metrics(np.vstack(y_true), np.vstack(y_score),
+                                     sample_weight=None if sample_weight is None else np.vstack(sample_weight))
+    for i, feature_importances in enumerate(rankings):
+        stats.update(feature_importances=feature_importances,
+                     permutation_importances=permutations[i] if permutations else None,
+                     accuracy=metrics["accuracy"][i], auc=metrics["auc"][i], pr_auc=metrics["pr_auc"][i])
+    return stats
+
+
+class RunBatch(object):
+    """
+    Runs waiting to be added to a RunAggregator. Their test labels and scores are kept until batch_size runs have
+    been added, and then turned into metrics all at once by update_stats, so memory holds at most batch_size test
+    sets whatever the number of iterations.
+
+    Attributes
+    ----------
+    stats:
+        RunAggregator the runs are added to.
+    batch_size: `int`
+        number of runs whose metrics are computed together.
+
+    """
 
+    def __init__(self, stats, batch_size=64):
+        self.stats = stats
+        self.batch_size = batch_size
+        self._runs = ([], [], [], [], [])
+
+    def add(self, feature_importances, y_true, y_score, sample_weight=None, permutation_importances=None):
+        for values, value in zip(self._runs, (feature_importances, y_true, y_score, sample_weight,
+                                              permutation_importances)):
+            values.append(value)
+        if len(self._runs[0]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Add the waiting runs to stats, and return it.
+        """
+        rankings, y_true, y_score, weights, permutations = self._runs
+        update_stats(self.stats, rankings, y_true, y_score,
+                     sample_weight=weights if weights and weights[0] is not None else None,
+                     permutations=permutations if permutations and permutations[0] is not None else None)
+        self._runs = ([], [], [], [], [])
+        return self.stats
+
+
+def grow_forest(random_forest, X_train, y_train, n_estimators):
+    """
+    Bring a fitted random forest to n_estimators trees. Trees are added to a smaller forest and the existing ones are
+    kept (warm start); a larger forest is fitted again from scratch. Either way, a seeded forest ends up with the same
+    trees as one fitted from scratch with n_estimators.
+
+    Returns
+    -------
+    changed
+        `True` if the forest was grown or fitted again.
 
-def one_to_many_classification(X_train, X_test, y_train, y_test, feature_order):
+    """
+    if n_estimators == random_forest.n_estimators:
+        return False
+    random_forest.set_params(warm_start=n_estimators > random_forest.n_estimators, n_estimators=n_estimators)
+    random_forest.fit(X_train, y_train)
+    return True
+
+
+def one_to_many_classification(X_train, X_test, y_train, y_test, feature_order, random_state=None, n_estimators=5,
+                               return_forest=False):
     """
     Binary classification of one kind vs. others (many).
 
@@ -70,29 +229,117 @@ def one_to_many_classification(X_train, X_test, y_train, y_test, feature_order):
     y_train
     y_test
     feature_order
+    random_state
+    n_estimators
+        number of trees in the random forest.
+    return_forest
+        if `True`, the fitted random forest is returned as well.
 
     Returns
     -------
 
     """
-    random_forest = RandomForestClassifier(n_estimators=5, criterion='gini', oob_score=False, max_features="log2")
-    random_forest.fit(X_train, y_train)
+    random_forest = fit_forest(X_train, y_train, random_state=random_state, n_estimators=n_estimators)
 
-    accuracy = random_forest.score(X_test, y_test)
-    y_pred = random_forest.predict(X_test)
+    accuracy, feature_importance, AUC = evaluate_forest(random_forest, X_test, y_test, feature_order)
+    if return_forest:
+        return accuracy, feature_importance, AUC, random_forest
+    return accuracy, feature_importance, AUC
 
-    feature_importance = sorted(
-        zip(map(lambda x: round(x, 4), random_forest.feature_importances_), feature_order), reverse=True
-    )
 
-    # print("[Binary classification] y_test:{}; y_pred:{}".format(y_test, y_pred))
-    AUC = roc_auc_score(y_test, y_pred)
-    return accuracy, feature_importance, AUC
+def data_digest(X, Y, chunk_rows=65536):
+    """
+    sha256 digest of the features and labels of a data set, hashed chunk_rows rows at a time so that a memory-mapped
+    table is never loaded at once.
+    """
+    digest = hashlib.sha256()
+    for array in (X, Y):
+        digest.update(("%s%r" % (array.dtype.str, array.shape)).encode("utf-8"))
+        for begin in range(0, len(array), chunk_rows):
+            digest.update(np.ascontiguousarray(array[begin:begin + chunk_rows]).tobytes())
+    return digest.hexdigest()
 
 
-def many_classifications(X, Y, feature_order, N):
+def load_state(state_path, X, Y, feature_order, random_state, targets=None):
     """
-    Does one_to_many_classification N times and aggregate the outputs from it.
+    Load the forests, splits and results saved by many_classifications, or an empty state if there is none yet.
+
+    A saved state is only reused for the same data (features and binary labels, compared by digest), features,
+    seed and targets.
+    """
+    targets = None if targets is None else list(targets)
+    # the data is only hashed when the state is read from or written to a file.
+    digest = None if state_path is None else data_digest(X, Y)
+    if state_path is None or not os.path.exists(state_path):
+        return {"n_samples": len(Y), "feature_order": list(feature_order), "random_state": random_state,
+                "digest": digest, "targets": targets, "splits": [], "forests": [], "results": []}
+
+    with open(state_path, 'rb') as f:
+        state = pickle.load(f)
+
+    expected = (len(Y), list(feature_order), random_state, digest, targets)
+    saved = (state["n_samples"], state["feature_order"], state["random_state"], state.get("digest"),
+             state.get("targets"))
+    if saved != expected:
+        raise ValueError("%s was saved for another data set, labels, target, feature set or seed" % state_path)
+    return state
+
+
+def save_state(state_path, state):
+    tmp = "%s.%d.tmp" % (state_path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, state_path)
+
+
+# data shared by the new iterations of many_classifications, attached once per worker process.
+_shared = {}
+
+
+def _install(handles, feature_order, n_estimators, permutation_repeats, permutation_jobs, keep_forests):
+    _shared.clear()
+    _shared.update(attach(handles))
+    _shared.update(feature_order=feature_order, n_estimators=n_estimators, permutation_repeats=permutation_repeats,
+                   permutation_jobs=permutation_jobs, keep_forests=keep_forests)
+
+
+def _new_iteration(task):
+    """
+    Fit and score the forest of one iteration. The task is only the row of the iteration in the shared split arrays
+    and its seed.
+    """
+    row, seed = task
+    X, Y = _shared["X"], _shared["Y"]
+    train_index, test_index = _shared["train"][row], _shared["test"][row]
+    X_test = X[test_index]
+
+    random_forest = fit_forest(X[train_index], Y[train_index], random_state=seed,
+                               n_estimators=_shared["n_estimators"])
+    feature_importances, scores = score_forest(random_forest, X_test, _shared["feature_order"])
+    permutation = None
+    if _shared["permutation_repeats"]:
+        permutation = permutation_importance(
+            random_forest, X_test, Y[test_index], auc_scorer(random_forest.classes_),
+            n_repeats=_shared["permutation_repeats"], random_state=seed, n_jobs=_shared["permutation_jobs"]
+        )
+    return feature_importances, scores, permutation, random_forest if _shared["keep_forests"] else None
+
+
+def many_classifications(X, Y, feature_order, N, random_state=None, n_estimators=5, state_path=None,
+                         permutation_repeats=0, permutation_jobs=1, n_jobs=1, targets=None):
+    """
+    Does one_to_many_classification N times, each on its own stratified split, and aggregate the outputs from it.
+
+    If state_path is given, the fitted forests, splits and results are saved there, and a later call only does the
+    extra work: iterations beyond the saved ones are run from scratch, saved forests with fewer than n_estimators
+    trees are grown to n_estimators, and those with more are fitted again, and the changed forests are evaluated
+    again. A state saved for other data, labels or targets is rejected.
+
+    Every forest is run once over its test set; the metrics are then computed together from the stacked predicted
+    probabilities of batches of iterations (see RunBatch), so memory does not grow with N.
+
+    New iterations can be spread over n_jobs processes: X, Y and the split indices are broadcast once (see
+    shared.broadcast) and every task only carries the number of its iteration and its seed.
 
     Parameters
     ----------
@@ -100,63 +347,414 @@ def many_classifications(X, Y, feature_order, N):
     Y
     feature_order
     N
+    random_state
+        master seed for the splits and the random forests.
+    n_estimators
+        number of trees in every random forest.
+    state_path
+        path of the file in which the incremental state is kept.
+    permutation_repeats
+        if positive, the permutation importance (decrease of AUC) of the features is computed with every fitted
+        forest, with this number of shuffles of every feature.
+    permutation_jobs
+        number of threads computing permutation importance.
+    n_jobs
+        number of worker processes for the new iterations. -1 uses all CPUs.
+    targets
+        labels of interest the binary labels Y were made from, checked against the saved state.
 
     Returns
     -------
+    stats
+        RunAggregator with the rank frequency of the features (and their permutation_frequency) and the "accuracy",
+        "auc" and "pr_auc" metrics.
 
     """
     # print("X: {}; Y: {}".format(X, Y))
+    X = np.asarray(X)
+    Y = np.asarray(Y)
 
-    list_important_features = []
-    list_accuracies = []
-    list_auc = []
-    for i in range(N):
+    state = load_state(state_path, X, Y, feature_order, random_state, targets=targets)
+    done = min(N, len(state["splits"]))
+
+    if len(state["splits"]) < N:
+        splits = list(stratified_splits(Y, N, random_state=random_state))
+        state["splits"].extend(splits[len(state["splits"]):])
+    seeds = spawn_seeds(random_state, N)
+    batch = RunBatch(RunAggregator(feature_order))
+
+    for i in range(done):
         print("i:%d" % i)
-        X_train, X_test, y_train, y_test = split_train_test(X, Y)
+        train_index, test_index = state["splits"][i]
+        X_train, X_test = X[train_index], X[test_index]
+        y_train, y_test = Y[train_index], Y[test_index]
         # print("X_train: {}; y_train:{}".format(X_train, y_train))
-        accuracy, feature_importances, auc = one_to_many_classification(X_train, X_test, y_train, y_test, feature_order)
-        list_important_features.append(feature_importances)
-        list_accuracies.append(accuracy)
-        list_auc.append(auc)
 
-    return list_accuracies, list_important_features, list_auc
+        random_forest = state["forests"][i]
+        # results saved before probabilities were kept (accuracy, ranking, AUC) are scored again.
+        if grow_forest(random_forest, X_train, y_train, n_estimators) or len(state["results"][i]) != 2:
+            state["results"][i] = score_forest(random_forest, X_test, feature_order)
+        feature_importances, scores = state["results"][i]
+
+        permutation = None
+        if permutation_repeats:
+            permutation = permutation_importance(
+                random_forest, X_test, y_test, auc_scorer(random_forest.classes_), n_repeats=permutation_repeats,
+                random_state=seeds[i], n_jobs=permutation_jobs
+            )
+        batch.add(feature_importances, y_test, scores, permutation_importances=permutation)
+
+    # all the splits have the same sizes, so the indices of the new iterations are stacked into two arrays.
+    new_splits = state["splits"][done:N]
+    arrays = {"X": X, "Y": Y,
+              "train": np.array([train_index for train_index, _ in new_splits], dtype=np.int64),
+              "test": np.array([test_index for _, test_index in new_splits], dtype=np.int64)}
+    with broadcast(arrays, n_jobs=n_jobs) as handles:
+        results = parallel_map(_new_iteration, enumerate(seeds[done:N]), n_jobs=n_jobs, initializer=_install,
+                               initargs=(handles, feature_order, n_estimators, permutation_repeats, permutation_jobs,
+                                         state_path is not None))
+        for i, (feature_importances, scores, permutation, random_forest) in enumerate(results, done):
+            print("i:%d" % i)
+            # forests and per-iteration results are only kept when they are saved for later calls.
+            if state_path is not None:
+                state["forests"].append(random_forest)
+                state["results"].append((feature_importances, scores))
+            batch.add(feature_importances, Y[state["splits"][i][1]], scores, permutation_importances=permutation)
+
+    if state_path is not None:
+        save_state(state_path, state)
+
+    return batch.flush()
+
+
+def target_strata(Y, targets):
+    """
+    Strata of the splits shared by several targets: one per target, and one for all the other labels. A target with
+    a single row joins the other labels, since a stratum needs at least two rows; if the other labels are then still
+    a single row (e.g. when every label is a target), that row joins the largest stratum.
+
+    Returns
+    -------
+    strata
+        numpy array of stratum numbers: the index of the target of every row, or len(targets) for the others.
+
+    """
+    Y = np.asarray(Y)
+    rest = len(targets)
+    strata = np.full(len(Y), rest, dtype=np.int64)
+    for k, target in enumerate(targets):
+        strata[Y == target] = k
+    counts = np.bincount(strata, minlength=rest + 1)
+    strata[counts[strata] < 2] = rest
+    counts = np.bincount(strata, minlength=rest + 1)
+    if counts[rest] == 1:
+        strata[strata == rest] = np.argmax(counts)
+    return strata
+
+
+def many_targets(X, Y, feature_order, N, targets=None, random_state=None, n_estimators=5):
+    """
+    Does many_classifications for several labels of interest at once.
+
+    The N splits are drawn once and shared by all the targets, so every target is evaluated on the same training and
+    test rows, and the binary labels of a target are a boolean mask of Y. The splits are stratified on the targets
+    and the rest of the labels (see target_strata), so rare non-target classes do not prevent them. The forests of
+    iteration i use the same seed for every target.
+
+    Parameters
+    ----------
+    X
+    Y
+        multi-class labels.
+    feature_order
+    N
+        number of iterations.
+    targets
+        labels of interest, or `None` for all the labels of Y.
+    random_state
+        master seed for the splits and the random forests.
+    n_estimators
+        number of trees in every random forest.
+
+    Returns
+    -------
+    stats
+        an OrderedDict: target -> RunAggregator with the rank frequency of the features and the "accuracy" and
+        "auc" metrics.
+
+    """
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    targets = list(np.unique(Y)) if targets is None else list(targets)
+    masks = OrderedDict((target, (Y == target).astype(int)) for target in targets)
+    seeds = spawn_seeds(random_state, N)
+    batches = OrderedDict((target, RunBatch(RunAggregator(feature_order))) for target in targets)
+
+    strata = target_strata(Y, targets)
+    for i, (train_index, test_index) in enumerate(stratified_splits(strata, N, random_state=random_state)):
+        print("i:%d" % i)
+        X_train, X_test = X[train_index], X[test_index]
+        for target, y in masks.items():
+            random_forest = fit_forest(X_train, y[train_index], random_state=seeds[i], n_estimators=n_estimators)
+            feature_importances, scores = score_forest(random_forest, X_test, feature_order)
+            batches[target].add(feature_importances, y[test_index], scores)
+
+    return OrderedDict((target, batch.flush()) for target, batch in batches.items())
+
+
+def write_report(stats, filename):
+    """
+    Write one csv row per target: the mean and standard deviation of AUC and accuracy over the runs, and the mean
+    importance rank of every feature.
+
+    Parameters
+    ----------
+    stats
+        target -> RunAggregator, as returned by many_targets.
+    filename
+        path of the csv file.
+
+    """
+    feature_order = next(iter(stats.values())).feature_order
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["target", "runs", "auc_mean", "auc_std", "pr_auc_mean", "accuracy_mean", "accuracy_std"] +
+                        ["rank_" + feature for feature in feature_order])
+        for target, aggregator in stats.items():
+            writer.writerow([target, aggregator.n_runs,
+                             aggregator.mean("auc"), np.sqrt(aggregator.variance("auc")), aggregator.mean("pr_auc"),
+                             aggregator.mean("accuracy"), np.sqrt(aggregator.variance("accuracy"))] +
+                            aggregator.mean_rank().tolist())
+
+
+def sample_split(positives, negatives, rng, test_size=0.3, negatives_per_positive=None, max_positives=None):
+    """
+    Draw a stratified training and test sample of row indices, without touching the feature matrix.
+
+    Positives are all kept (or max_positives of them), and negatives are subsampled uniformly to
+    negatives_per_positive times as many. Both classes are then split with the same test_size. Every sampled negative
+    stands for n_negatives / n_sampled_negatives rows of the full table, and is weighted accordingly (inverse
+    sampling probability), so weighted metrics estimate those of the full table.
+
+    Parameters
+    ----------
+    positives
+        sorted row indices of the positive class.
+    negatives
+        sorted row indices of the negative class.
+    rng
+        numpy.random.Generator.
+    test_size
+        proportion of every class in the test set.
+    negatives_per_positive
+        ratio of sampled negatives to sampled positives, or `None` to keep all the negatives.
+    max_positives
+        maximum number of sampled positives, or `None` to keep all of them.
+
+    Returns
+    -------
+    train_index, test_index
+        sorted row indices.
+    train_weight, test_weight
+        weight of every row of train_index and test_index.
+
+    """
+    n_pos = len(positives) if max_positives is None else min(max_positives, len(positives))
+    n_neg = len(negatives) if negatives_per_positive is None else \
+        min(len(negatives), int(np.ceil(negatives_per_positive * n_pos)))
+
+    sampled = []
+    for rows, n in ((positives, n_pos), (negatives, n_neg)):
+        weight = len(rows) / float(max(n, 1))
+        # Generator.choice samples k of n without building a permutation of all n.
+        chosen = rows[rng.choice(len(rows), n, replace=False)]
+        n_test = int(np.ceil(test_size * n))
+        sampled.append((chosen[n_test:], chosen[:n_test], weight))
+
+    train_index = np.concatenate([train for train, test, weight in sampled])
+    test_index = np.concatenate([test for train, test, weight in sampled])
+    train_weight = np.concatenate([np.full(len(train), weight) for train, test, weight in sampled])
+    test_weight = np.concatenate([np.full(len(test), weight) for train, test, weight in sampled])
+
+    train_order, test_order = np.argsort(train_index), np.argsort(test_index)
+    return train_index[train_order], test_index[test_order], train_weight[train_order], test_weight[test_order]
+
+
+def plot_rows(y, n_rows, rng):
+    """
+    Sorted row indices of a sample of at most n_rows rows of a binary labelling to plot: half of them positives (or
+    all the positives, if there are fewer) and the rest negatives.
+    """
+    positives, negatives = np.flatnonzero(y), np.flatnonzero(~y)
+    n_pos = min(len(positives), max(n_rows // 2, n_rows - len(negatives)))
+    n_neg = min(len(negatives), n_rows - n_pos)
+    return np.sort(np.concatenate((positives[rng.choice(len(positives), n_pos, replace=False)],
+                                   negatives[rng.choice(len(negatives), n_neg, replace=False)])))
+
+
+def take_rows(X, index, columns=None):
+    """
+    Rows (and optionally columns) of a possibly memory-mapped matrix, reading only the pages holding them.
+    """
+    rows = np.asarray(X[index], dtype=np.float64)
+    return rows if columns is None else rows[:, columns]
+
+
+def out_of_core_classifications(X, y, feature_order, N, random_state=None, n_estimators=5, columns=None,
+                                test_size=0.3, negatives_per_positive=None, max_positives=None):
+    """
+    Same as many_classifications for tables too large for memory, e.g. a memory-mapped node feature store.
+
+    Every iteration draws its own stratified sample of rows (see sample_split) and only reads those rows of X, so
+    memory is bounded by the sample rather than by the table. With negative subsampling, the forests are fitted and
+    evaluated with inverse-probability weights, so accuracy and AUC estimate those on the full table.
+
+    Parameters
+    ----------
+    X
+        feature matrix, typically a read-only numpy.memmap.
+    y
+        binary labels (1 for the label of interest) for every row of X.
+    feature_order
+        names of the features used, in the order of columns.
+    N
+        number of iterations.
+    random_state
+        master seed for the samples and the random forests.
+    n_estimators
+        number of trees in every random forest.
+    columns
+        indices of the columns of X to use, or `None` for all of them.
+    test_size
+        proportion of every class in the test set.
+    negatives_per_positive, max_positives
+        see sample_split.
+
+    Returns
+    -------
+    stats
+        RunAggregator with the rank frequency of the features and the "accuracy", "auc" and "pr_auc" metrics.
+
+    """
+    y = np.asarray(y).astype(bool)
+    positives = np.flatnonzero(y)
+    negatives = np.flatnonzero(~y)
+    seeds = spawn_seeds(random_state, N)
+    batch = RunBatch(RunAggregator(feature_order))
+
+    for i in range(N):
+        print("i:%d" % i)
+        rng = np.random.default_rng(seeds[i])
+        train_index, test_index, train_weight, test_weight = sample_split(
+            positives, negatives, rng, test_size=test_size, negatives_per_positive=negatives_per_positive,
+            max_positives=max_positives
+        )
+
+        random_forest = fit_forest(take_rows(X, train_index, columns), y[train_index].astype(int),
+                                   random_state=seeds[i], n_estimators=n_estimators, sample_weight=train_weight)
+        feature_importances, scores = score_forest(random_forest, take_rows(X, test_index, columns), feature_order)
+        batch.add(feature_importances, y[test_index], scores, sample_weight=test_weight)
+
+    return batch.flush()
 
 
 @click.command()
 @click.option('--csv', nargs=1, type=str, help='CSV data for the features.')
+@click.option('--store', nargs=1, type=str, default=None,
+              help='Feature store directory (e.g. written by node_features.py) to memory-map instead of --csv.')
 @click.option('--features', '-f', multiple=True)
 @click.option('--iter', nargs=1, type=int, help='Number of iterations for the random forest.')
-def main(csv, features, iter):
+@click.option('--seed', nargs=1, type=int, default=None, help='Master seed for reproducible iterations.')
+@click.option('--trees', nargs=1, type=int, default=5, help='Number of trees in every random forest.')
+@click.option('--state', nargs=1, type=str, default=None,
+              help='File keeping fitted forests and splits, so that more iterations or trees only add the difference.')
+@click.option('--out-of-core', 'out_of_core', is_flag=True, default=False,
+              help='Sample the rows of every iteration from the memory-mapped table instead of loading it.')
+@click.option('--neg-ratio', 'neg_ratio', nargs=1, type=float, default=None,
+              help='With --out-of-core, number of sampled negatives per positive (default: all negatives).')
+@click.option('--max-pos', 'max_pos', nargs=1, type=int, default=None,
+              help='With --out-of-core, maximum number of sampled positives per iteration.')
+@click.option('--target', '-t', 'targets', multiple=True,
+              help='Label of interest (default: seed). With several, all of them are analysed on shared splits.')
+@click.option('--all-targets', 'all_targets', is_flag=True, default=False, help='Analyse every label as a target.')
+@click.option('--report', nargs=1, type=str, default='one_by_many_report.csv',
+              help='CSV report of AUC and feature ranks per target, with several targets.')
+@click.option('--permutation', nargs=1, type=int, default=0,
+              help='Number of shuffles per feature for permutation importance (default: 0, Gini importance only).')
+@click.option('--perm-jobs', 'perm_jobs', nargs=1, type=int, default=1,
+              help='Number of threads computing permutation importance.')
+@click.option('--jobs', nargs=1, type=int, default=1, help='Number of worker processes (-1 for all CPUs).')
+def main(csv, store, features, iter, seed, trees, state, out_of_core, neg_ratio, max_pos, targets, all_targets,
+         report, permutation, perm_jobs, jobs):
     # -f degree -f betweenness -f closeness -f eigencentrality -f coreness -f layerness -f pagerank -f sum_friends_friends -f transitivity
 
     column_names = ["NetworkType", "SubType"] + list(features)
     isSubType = True  # use SubType as the labels for classification
     at_least = 0
 
-    X, Y, sub_to_main_type, feature_order = init(csv, column_names, isSubType, at_least)
+    if store:
+        X, Y, sub_to_main_type, stored_features = load_store(store)
+        feature_order = sorted(features) if features else stored_features
+        columns = [stored_features.index(f) for f in feature_order]
+    else:
+        X, Y, sub_to_main_type, feature_order = init_cached(csv, column_names, isSubType, at_least)
+        columns = None
 
     N = iter
 
-    # network subtype one is interested in
-    one = "seed"
-
-    X_converted, Y_converted = convert_one_to_many(X, Y, one)
-
-    list_accuracies, list_important_features, list_auc = many_classifications(
-        X_converted, Y_converted, feature_order, N
-    )
-
-    print("average accuracy: %f" % (float(sum(list_accuracies)) / float(N)))
-    print("average AUC: %f" % (float(sum(list_auc)) / float(N)))
+    if all_targets or len(targets) > 1:
+        if state or permutation or jobs != 1:
+            raise click.UsageError("--state, --permutation and --jobs only apply to a single target")
+        if out_of_core:
+            stats = OrderedDict(
+                (target, out_of_core_classifications(
+                    X, np.asarray(Y) == target, feature_order, N, random_state=seed, n_estimators=trees,
+                    columns=columns, negatives_per_positive=neg_ratio, max_positives=max_pos))
+                for target in (np.unique(Y).tolist() if all_targets else targets)
+            )
+        else:
+            stats = many_targets(X if columns is None else np.asarray(X)[:, columns], Y, feature_order, N,
+                                 targets=None if all_targets else targets, random_state=seed, n_estimators=trees)
+        write_report(stats, report)
+        for target, aggregator in stats.items():
+            print("%s: average AUC %f, average accuracy %f" % (target, aggregator.mean("auc"),
+                                                               aggregator.mean("accuracy")))
+        return
 
-    dominant_features = plot_feature_importance(list_important_features, feature_order)
+    # network subtype one is interested in
+    one = targets[0] if targets else "seed"
+
+    if out_of_core:
+        y = np.asarray(Y) == one
+        stats = out_of_core_classifications(
+            X, y, feature_order, N, random_state=seed, n_estimators=trees, columns=columns,
+            negatives_per_positive=neg_ratio, max_positives=max_pos
+        )
+        # only a sample of the rows is read and plotted, whatever the size of the table.
+        index = plot_rows(y, PLOT_ROWS, np.random.default_rng(seed))
+        X_converted, Y_converted = take_rows(X, index, columns), y[index].astype(int)
+    else:
+        X_converted, Y_converted = convert_one_to_many(X if columns is None else np.asarray(X)[:, columns], Y, one)
+
+        stats = many_classifications(
+            X_converted, Y_converted, feature_order, N, random_state=seed, n_estimators=trees, state_path=state,
+            permutation_repeats=permutation, permutation_jobs=perm_jobs, n_jobs=jobs, targets=[one]
+        )
+
+    print("average accuracy: %f" % stats.mean("accuracy"))
+    print("average AUC: %f" % stats.mean("auc"))
+    print("average PR-AUC: %f" % stats.mean("pr_auc"))
+
+    dominant_features = plot_feature_importance(stats.rank_frequency, feature_order)
+    if permutation:
+        plot_feature_importance(stats.permutation_frequency, feature_order, filename="permutation_importance.pdf")
 
     first = dominant_features[0][0][0]
     second = dominant_features[1][0][0]
     if first == second:
         second = dominant_features[1][1][0]
 
-    Y_converted_string_labels = [one if y == 1 else "non-seed" for y in Y_converted]
+    Y_converted_string_labels = np.where(np.asarray(Y_converted) == 1, one, "non-" + one)
 
     x_label = first
     y_label = second
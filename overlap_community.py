@@ -1,7 +1,12 @@
-import itertools
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+import scipy.sparse as sp
 import scipy.cluster.hierarchy as sch
+from render import new_figure, finish
+from resampling import SAMPLING_METHODS
+
+import click
 
 NetworkTypeLabels = ['Gene regulation', 'Proteins', 'Food Web', 'Fungal', 'Metabolic', 'Connectome',
                      'PeerToPeer', 'Bayesian', 'Web Graph', 'Offline Social', 'Online Social', 'Affiliation',
@@ -17,33 +22,102 @@ random_over = [0, 0, 0, 1, 0, 2, 3, 1, 0, 2, 2, 2, 2, 0, 0, 3, 1, 0, 0, 1, 1, 1]
 smote = [0, 0, 0, 1, 0, 2, 3, 1, 0, 2, 0, 2, 0, 1, 0, 3, 1, 0, 0, 1, 1, 1]
 
 
-def matrix_clustering(D, leave_name):
-    f, ax = plt.subplots()
-    # Compute first dendrogram.
-    Y = sch.linkage(D)
-    Z1 = sch.dendrogram(Y, no_plot=True)
-
-    # Compute second dendrogram.
-    Y = sch.linkage(D)
-    Z2 = sch.dendrogram(Y, no_plot=True)
-
-    # Plot distance matrix.
-
-    idx1 = Z1['leaves']
-    idx2 = Z2['leaves']
-
-    D = D[idx1, :]
-    D = D[:, idx2]
-
-    for i in range(N):
-        for j in range(N):
-            D[i][j] = abs(D[i][j] - 4)
-
-        cmap = plt.get_cmap('Blues', 5)  # plt.cm.Blues
-    im = ax.imshow(D, aspect='auto', cmap=cmap, interpolation='nearest', vmin=0 - .5, vmax=4 + .5)
+def read_assignments(files):
+    """
+    (# of classes x # of methods) array of community assignments from files with one community per line (see
+    graph_draw.read_community), one file per method.
+    """
+    return np.column_stack([np.loadtxt(f, dtype=np.int64, ndmin=1) for f in files])
+
+
+def read_labels(filename):
+    with open(filename, 'r') as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+def sweep_methods(directory):
+    """
+    Sampling methods with a communities_<method>.txt file in the output directory of multi_run, in the order of
+    SAMPLING_METHODS (other names come after them, sorted).
+    """
+    prefix, suffix = "communities_", ".txt"
+    found = [name[len(prefix):-len(suffix)] for name in os.listdir(directory)
+             if name.startswith(prefix) and name.endswith(suffix)]
+    order = dict((method, i) for i, method in enumerate(SAMPLING_METHODS))
+    return sorted(found, key=lambda method: (order.get(method, len(order)), method))
+
+
+def read_sweep(directory, methods=None):
+    """
+    Labels and assignments written by multi_run --sweep (or several --sampling): labels.txt and
+    communities_<method>.txt for every method, by default all the methods found in directory.
+    """
+    methods = sweep_methods(directory) if methods is None else list(methods)
+    if not methods:
+        raise ValueError("no communities_<method>.txt file in %s" % directory)
+    files = [os.path.join(directory, "communities_%s.txt" % method) for method in methods]
+    return read_labels(os.path.join(directory, "labels.txt")), read_assignments(files)
+
+
+def overlap_matrix(assignments):
+    """
+    Disagreement matrix of community assignments: entry (i, j) is the number of methods that put classes i and j
+    in different communities.
+
+    Every method is one-hot encoded, so the number of methods agreeing on every pair is the product of the sparse
+    (# of classes x total # of communities) encoding with its transpose.
+
+    Parameters
+    ----------
+    assignments:
+        integer array of shape (# of classes, # of methods).
+
+    Returns
+    -------
+    D: numpy array of shape (# of classes, # of classes), 0 on the diagonal.
+
+    """
+    assignments = np.asarray(assignments, dtype=np.int64)
+    if assignments.ndim == 1:
+        assignments = assignments[:, None]
+    n, n_methods = assignments.shape
+    # the communities of every method get their own range of columns.
+    _, columns = np.unique(assignments + np.arange(n_methods) * (assignments.max() + 1), return_inverse=True)
+    encoding = sp.csr_matrix((np.ones(columns.size), (np.repeat(np.arange(n), n_methods), columns.ravel())),
+                             shape=(n, columns.max() + 1))
+    return n_methods - encoding.dot(encoding.T).toarray()
+
+
+def matrix_clustering(D, leave_name, n_methods=None, filename='overlaps.png'):
+    """
+    Plot a disagreement matrix with its rows and columns in the order of the leaves of its dendrogram, shaded by the
+    number of agreeing methods.
+
+    Parameters
+    ----------
+    D:
+        numpy array from overlap_matrix.
+    leave_name:
+        labels of the rows.
+    n_methods: `int`
+        number of methods compared, by default the largest entry of D.
+    filename:
+        output path, or `None` to show the figure.
+
+    """
+    D = np.asarray(D)
+    if n_methods is None:
+        n_methods = int(D.max()) if D.size else 0
+    leaves = sch.dendrogram(sch.linkage(D), no_plot=True)['leaves']
+    agreements = np.abs(D[np.ix_(leaves, leaves)] - n_methods)
+
+    f = new_figure(filename)
+    ax = f.add_subplot(111)
+    cmap = plt.get_cmap('Blues', n_methods + 1)
+    im = ax.imshow(agreements, aspect='auto', cmap=cmap, interpolation='nearest', vmin=-.5, vmax=n_methods + .5)
 
     # mapping from an index to an axis label (gml file name, NetworkType, SubType)
-    axis_labels = [leave_name[i] for i in idx1]
+    axis_labels = [leave_name[i] for i in leaves]
 
     tick_marks = np.arange(len(axis_labels))
     ax.set_xticks(tick_marks)
@@ -52,40 +126,36 @@ def matrix_clustering(D, leave_name):
     ax.set_yticklabels(axis_labels)
 
     # Plot colorbar.
-    f.colorbar(im, ticks=np.arange(0, 5))
+    f.colorbar(im, ticks=np.arange(0, n_methods + 1))
     f.tight_layout()
-
-    plt.show()
-    plt.savefig('overlaps.png', bbox_inches='tight')
+    finish(f, filename, bbox_inches='tight')
 
 
 def count_overlaps(L1, L2):
-    return sum([1 if l1 == l2 else 0 for l1, l2 in zip(L1, L2)])
-
-
-def main():
-    matrix = np.zeros((N, N))
-    combined = zip(none, random_over, random_under, smote)
-
-    for first, second in itertools.permutations(NetworkTypeLabels, 2):
-        combined = list(zip(none, random_over, random_under, smote))
-        i = NetworkTypeLabels.index(first)
-        j = NetworkTypeLabels.index(second)
-        e_i = combined[i]
-        e_j = combined[j]
-
-        print(first, second)
-        print(e_i, e_j)
-
-        num_overlaps = count_overlaps(e_i, e_j)
-        print(num_overlaps)
-        print("-------------------")
-        matrix[i][j] = 4 - num_overlaps
-
-    # for i in range(N):
-    # 	matrix[i][i] = 4
-
-    matrix_clustering(matrix, NetworkTypeLabels)
+    return int(np.sum(np.asarray(L1) == np.asarray(L2)))
+
+
+@click.command()
+@click.option('--sweep-dir', 'sweep_dir', nargs=1, type=str, default=None,
+              help='Output directory of multi_run --sweep (labels.txt and communities_<method>.txt).')
+@click.option('--labels', nargs=1, type=str, default=None,
+              help='With --communities, file with the class labels, one per line (default: row numbers).')
+@click.option('--communities', multiple=True, help='File with the community of every class, one per line.')
+@click.option('--output', nargs=1, type=str, default='overlaps.png', help='Output figure.')
+def main(sweep_dir, labels, communities, output):
+    """
+    Plot how often the communities of the classes agree across sampling methods. Without input files, the
+    published assignments of the 22 network subtypes are used.
+    """
+    if sweep_dir:
+        leave_name, assignments = read_sweep(sweep_dir)
+    elif communities:
+        assignments = read_assignments(communities)
+        leave_name = read_labels(labels) if labels else [str(i) for i in range(len(assignments))]
+    else:
+        leave_name, assignments = NetworkTypeLabels, np.column_stack((none, random_over, random_under, smote))
+
+    matrix_clustering(overlap_matrix(assignments), leave_name, n_methods=assignments.shape[1], filename=output)
 
 
 if __name__ == '__main__':
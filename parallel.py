@@ -0,0 +1,157 @@
+import os
+import time
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+def spawn_seeds(seed, n):
+    """
+    Derive n independent integer seeds from a master seed.
+
+    The i-th seed only depends on the master seed and i, so the seeds of a run do not change with the number of
+    runs or with the number of workers they are spread over.
+
+    Parameters
+    ----------
+    seed: `int` or `None`
+        master seed. If `None`, fresh entropy is drawn from the OS.
+    n: `int`
+        number of seeds.
+
+    Returns
+    -------
+    seeds: `list`
+        a list of n integers usable as `random_state` for numpy and scikit-learn.
+
+    """
+    children = np.random.SeedSequence(seed).spawn(n)
+    return [int(child.generate_state(1)[0]) for child in children]
+
+
+def effective_jobs(n_jobs):
+    """
+    Resolve the number of worker processes. Non-positive values count back from the number of CPUs, i.e. -1 means
+    all CPUs.
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs <= 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def parallel_map(func, tasks, n_jobs=1, initializer=None, initargs=()):
+    """
+    Apply func to every task, optionally over a pool of processes.
+
+    Results are returned in the order of tasks, regardless of how many workers are used, so that any reduction done
+    over them by the caller is reproducible.
+
+    Parameters
+    ----------
+    func:
+        a picklable (i.e. module-level) function taking a single task.
+    tasks:
+        an iterable of tasks.
+    n_jobs: `int`
+        number of worker processes. 1 runs everything in the current process.
+    initializer:
+        function called once in every worker (and once in the current process if n_jobs is 1), e.g. to install
+        data shared by all the tasks.
+    initargs: `tuple`
+        arguments for the initializer.
+
+    Returns
+    -------
+    results: `iterator`
+        results of func, in the order of tasks.
+
+    """
+    n_jobs = effective_jobs(n_jobs)
+    if n_jobs == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for task in tasks:
+            yield func(task)
+        return
+
+    tasks = list(tasks)
+    chunksize = max(1, len(tasks) // (n_jobs * 4))
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=initializer, initargs=initargs) as executor:
+        for result in executor.map(func, tasks, chunksize=chunksize):
+            yield result
+
+
+def _call_and_send(func, task, conn):
+    try:
+        conn.send(("ok", func(task)))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def map_with_timeout(func, tasks, n_jobs=1, timeout=None):
+    """
+    Apply func to every task in its own process, with a time limit per task.
+
+    Up to n_jobs tasks run at the same time. A task running longer than timeout seconds is killed, so one
+    pathological input cannot hold up the whole job. Results are yielded as soon as their task ends, which is not
+    necessarily in the order of tasks.
+
+    Parameters
+    ----------
+    func:
+        function taking a single task. Its return value must be picklable.
+    tasks:
+        an iterable of tasks.
+    n_jobs: `int`
+        maximum number of tasks running at the same time. -1 uses all CPUs.
+    timeout: `float`
+        time limit of every task in seconds, or `None` for no limit.
+
+    Returns
+    -------
+    results: `iterator`
+        (task, status, value) tuples. status is "ok" with the return value of func, "error" with the traceback of
+        the exception it raised, or "timeout" with `None`.
+
+    """
+    n_jobs = effective_jobs(n_jobs)
+    pending = list(tasks)[::-1]
+    running = {}
+
+    while pending or running:
+        while pending and len(running) < n_jobs:
+            task = pending.pop()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_call_and_send, args=(func, task, sender), daemon=True)
+            process.start()
+            sender.close()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            running[receiver] = (process, task, deadline)
+
+        deadlines = [deadline for process, task, deadline in running.values() if deadline is not None]
+        wait_for = None if not deadlines else max(0.0, min(deadlines) - time.monotonic())
+
+        for receiver in wait(list(running), timeout=wait_for):
+            process, task, deadline = running.pop(receiver)
+            try:
+                status, value = receiver.recv()
+            except EOFError:
+                status, value = "error", "worker exited with code %s" % process.exitcode
+            receiver.close()
+            process.join()
+            yield task, status, value
+
+        now = time.monotonic()
+        for receiver, (process, task, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.terminate()
+                process.join()
+                receiver.close()
+                del running[receiver]
+                yield task, "timeout", None
@@ -0,0 +1,311 @@
+import math
+import time
+import numpy as np
+
+
+def parse_method(spec, names=("exact", "pivots", "hyperanf")):
+    """
+    Parse the description of a path-feature estimator.
+
+    Valid descriptions are "exact", "pivots,k=256,seed=0", "pivots,epsilon=0.05,time=60,seed=0" and
+    "hyperanf,log2m=6,seed=0". For pivot sampling, k is the number of pivots; alternatively epsilon is the additive
+    error (relative to the diameter) from which the number of pivots log(n) / epsilon^2 is derived, and time caps
+    the seconds spent on pivots. For HyperANF, log2m is the log2 of the number of registers per node.
+
+    Parameters
+    ----------
+    spec: `str`
+        description of the estimator.
+    names:
+        valid estimator names.
+
+    Returns
+    -------
+    name: `str`
+        "exact", "pivots" or "hyperanf".
+    params: `dict`
+        parameters of the estimator.
+
+    """
+    parts = [p.strip() for p in (spec or "exact").split(",") if p.strip()]
+    name, params = parts[0], {}
+    for part in parts[1:]:
+        key, value = part.split("=")
+        params[key.strip()] = float(value) if key.strip() in ("epsilon", "time", "fraction") else int(value)
+
+    if name not in names:
+        raise ValueError("unknown estimator: %s" % spec)
+    return name, params
+
+
+def _pivots(n, params):
+    """
+    Random pivot vertices and the time budget for them, from the parameters of "pivots".
+    """
+    if "k" in params:
+        k = params["k"]
+    else:
+        k = int(math.ceil(math.log(max(n, 2)) / params.get("epsilon", 0.1) ** 2))
+    k = min(k, n)
+    rng = np.random.RandomState(params.get("seed", 0))
+    return rng.choice(n, k, replace=False), params.get("time")
+
+
+def _bfs_distances(G, source):
+    """
+    Distances from source to every vertex, -1 for unreachable ones.
+    """
+    vids, layers, parents = G.bfs(source)
+    layers = np.asarray(layers)
+    distances = np.full(G.vcount(), -1, dtype=np.int64)
+    distances[np.asarray(vids, dtype=np.int64)] = np.repeat(np.arange(len(layers) - 1), np.diff(layers))
+    return distances
+
+
+def _sample(G, params, visit):
+    """
+    Call visit(pivot) for random pivots until their number or the time budget is exhausted.
+
+    Returns
+    -------
+    k: `int`
+        number of pivots visited.
+
+    """
+    pivots, budget = _pivots(G.vcount(), params)
+    start = time.monotonic()
+    k = 0
+    for pivot in pivots:
+        if k > 0 and budget is not None and time.monotonic() - start > budget:
+            break
+        visit(int(pivot))
+        k += 1
+    return k
+
+
+def _record(name, params, k=None):
+    """
+    Description of the estimator actually used, recorded next to the value in the feature table.
+    """
+    if name == "exact":
+        return "exact"
+    if name == "pivots":
+        return "pivots,k=%d,seed=%d" % (k, params.get("seed", 0))
+    return "hyperanf,log2m=%d,seed=%d" % (params.get("log2m", 6), params.get("seed", 0))
+
+
+def mean_geodesic_distance(G, method="exact"):
+    """
+    Mean shortest-path distance between connected pairs of vertices of an undirected graph.
+
+    With "pivots", breadth-first searches are only run from random pivots and the distances from them are averaged.
+    With "hyperanf", the neighbourhood function is estimated with HyperLogLog counters (see hyperanf).
+
+    Returns
+    -------
+    value: `float`
+    record: `str`
+        the estimator actually used.
+
+    """
+    name, params = parse_method(method)
+    if name == "exact":
+        return G.average_path_length(directed=False), _record(name, params)
+
+    if name == "hyperanf":
+        neighbourhood = hyperanf(G, log2m=params.get("log2m", 6), seed=params.get("seed", 0))
+        pairs = np.diff(neighbourhood)
+        value = float(np.dot(np.arange(1, len(neighbourhood)), pairs) / pairs.sum()) if pairs.sum() > 0 \
+            else float("nan")
+        return value, _record(name, params)
+
+    totals = [0, 0]
+
+    def visit(pivot):
+        vids, layers, parents = G.bfs(pivot)
+        sizes = np.diff(layers)
+        totals[0] += int(np.dot(np.arange(len(sizes)), sizes))
+        totals[1] += len(vids) - 1
+
+    k = _sample(G, params, visit)
+    value = totals[0] / float(totals[1]) if totals[1] else float("nan")
+    return value, _record(name, params, k)
+
+
+def betweenness(G, method="exact"):
+    """
+    Betweenness of every vertex of an undirected graph.
+
+    With "pivots", only the shortest paths starting from random pivots are counted, scaled by n / k.
+
+    Returns
+    -------
+    values: numpy array
+    record: `str`
+        the estimator actually used.
+
+    """
+    name, params = parse_method(method)
+    if name == "exact":
+        return np.array(G.betweenness(directed=False)), _record(name, params)
+    if name != "pivots":
+        raise ValueError("betweenness can only be estimated with pivots")
+
+    total = np.zeros(G.vcount())
+
+    def visit(pivot):
+        total[:] += G.betweenness(directed=False, sources=[pivot])
+
+    k = _sample(G, params, visit)
+    return total * G.vcount() / float(k), _record(name, params, k)
+
+
+def closeness(G, method="exact"):
+    """
+    Closeness (inverse of the mean distance to the reachable vertices) of every vertex of an undirected graph.
+
+    With "pivots", the mean distance of a vertex is estimated by its mean distance to random pivots
+    (Eppstein and Wang).
+
+    Returns
+    -------
+    values: numpy array
+    record: `str`
+        the estimator actually used.
+
+    """
+    name, params = parse_method(method)
+    if name == "exact":
+        return np.array(G.closeness(mode="all")), _record(name, params)
+    if name != "pivots":
+        raise ValueError("closeness can only be estimated with pivots")
+
+    sums = np.zeros(G.vcount())
+    counts = np.zeros(G.vcount())
+
+    def visit(pivot):
+        distances = _bfs_distances(G, pivot)
+        reached = distances > 0
+        sums[reached] += distances[reached]
+        counts[reached] += 1
+
+    k = _sample(G, params, visit)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = np.where(sums > 0, counts / sums, np.nan)
+    return values, _record(name, params, k)
+
+
+def _splitmix64(x):
+    x = (x + np.uint64(0x9E3779B97F4A7C15)) & np.uint64(0xFFFFFFFFFFFFFFFF)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _bit_length(w):
+    length = np.zeros(w.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = (w >> np.uint64(shift)) != 0
+        length[high] += shift
+        w = np.where(high, w >> np.uint64(shift), w)
+    return length + (w != 0)
+
+
+def _hll_estimate(registers):
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    estimate[small] = m * np.log(m / zeros[small].astype(np.float64))
+    return estimate
+
+
+def hyperanf(G, log2m=6, seed=0, max_iter=None, chunk_edges=1 << 22):
+    """
+    Estimate the neighbourhood function of an undirected graph with HyperANF (Boldi, Rosa and Vigna).
+
+    Every vertex holds a HyperLogLog counter of the vertices within distance t, and the counters of neighbours are
+    merged (register-wise maximum) once per step, in O(# of edges * 2^log2m) time and O(n * 2^log2m) bytes.
+
+    Parameters
+    ----------
+    G: `igraph.Graph`
+    log2m: `int`
+        log2 of the number of registers per counter. The relative standard error is about 1.04 / sqrt(2^log2m).
+    seed: `int`
+        seed of the hash function.
+    max_iter: `int`
+        maximum number of steps, or `None` to run until the counters stop changing.
+    chunk_edges: `int`
+        number of edge ends merged at a time, bounding the temporary memory.
+
+    Returns
+    -------
+    neighbourhood: numpy array
+        neighbourhood[t] is the estimated number of ordered pairs of vertices within distance t.
+
+    """
+    n, m = G.vcount(), 1 << log2m
+    hashes = _splitmix64(np.arange(n, dtype=np.uint64) ^ _splitmix64(np.array([seed], dtype=np.uint64)))
+    registers = np.zeros((n, m), dtype=np.uint8)
+    rank = (64 - log2m) - _bit_length(hashes >> np.uint64(log2m)) + 1
+    registers[np.arange(n), (hashes & np.uint64(m - 1)).astype(np.int64)] = rank
+
+    edges = np.array(G.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    sources = np.concatenate((edges[:, 0], edges[:, 1]))
+    targets = np.concatenate((edges[:, 1], edges[:, 0]))
+    order = np.argsort(sources, kind="stable")
+    sources, targets = sources[order], targets[order]
+    starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]]) if len(sources) else np.array([], dtype=int)
+    bounds = np.r_[starts, len(sources)]
+    # number of vertices merged at a time, so that about chunk_edges edge ends are gathered.
+    step = max(1, chunk_edges * len(starts) // max(1, len(sources)))
+
+    neighbourhood = [float(n)]
+    t = 0
+    while max_iter is None or t < max_iter:
+        updated = registers.copy()
+        for begin in range(0, len(starts), step):
+            group = starts[begin:begin + step]
+            end = bounds[begin + len(group)]
+            merged = np.maximum.reduceat(registers[targets[group[0]:end]], group - group[0], axis=0)
+            nodes = sources[group]
+            updated[nodes] = np.maximum(updated[nodes], merged)
+
+        t += 1
+        if np.array_equal(updated, registers):
+            break
+        registers = updated
+        neighbourhood.append(float(_hll_estimate(registers).sum()))
+
+    return np.array(neighbourhood)
+
+
+def diameter(G, method="exact"):
+    """
+    Longest shortest-path distance of an undirected graph.
+
+    With "pivots", only the eccentricities of random pivots are computed, which gives a lower bound.
+
+    Returns
+    -------
+    value: `float`
+    record: `str`
+        the estimator actually used.
+
+    """
+    name, params = parse_method(method)
+    if name == "exact":
+        return float(G.diameter(directed=False)), _record(name, params)
+    if name != "pivots":
+        raise ValueError("the diameter can only be estimated with pivots")
+
+    longest = [0]
+
+    def visit(pivot):
+        vids, layers, parents = G.bfs(pivot)
+        longest[0] = max(longest[0], len(layers) - 2)
+
+    k = _sample(G, params, visit)
+    return float(longest[0]), _record(name, params, k)
@@ -1,3 +1,4 @@
+import copy
 import math
 from sklearn import manifold
 from sklearn.decomposition import PCA
@@ -7,6 +8,10 @@ import matplotlib.pyplot as plt
 import matplotlib.colors
 import matplotlib.cm as cmx
 from preprocess import *
+from feature_store import init_cached
+from aggregate import rank_frequency
+from matrix_utils import normalize_rows, zero_mask
+from render import new_figure, finish
 
 import click
 
@@ -102,31 +107,23 @@ def plot_3d(data, feature_names):
 
 
 def make_mask(matrix):
-    matrix = np.array(matrix)
-    z = np.zeros(matrix.shape)
-    for i, row in enumerate(matrix):
-        for j, e_ij in enumerate(row):
-            if e_ij == 0:
-                z[i][j] = 1
-    return z
+    return zero_mask(matrix)
 
 
 def plot_confusion_matrix(cm, NetworkTypeLabels, sub_to_main_type, isSubType, filename=None):
     Domains = sorted(list(set(sub_to_main_type.values())))
     color_map = lambda i: colors_domain[i]
 
-    # normalized the confusion matrix by row
-    cm_normalized = cm.astype('float') / cm.sum(axis=1)[:, np.newaxis]
+    # normalized the confusion matrix by row, 0.0 for rows without any instance
+    cm_normalized_filtered = normalize_rows(cm)
 
-    # set 0.0 if the value of a cell is NaN
-    cm_normalized_filtered = list(map(lambda ax: list(map(lambda val: 0.0 if math.isnan(val) else val, ax)), cm_normalized))
-
-    f, ax = plt.subplots()
+    f = new_figure(filename)
+    ax = f.add_subplot(111)
 
     # if the cell's value is 0.0, the color becomes white, which is accomplished by using mask.
     mask = make_mask(cm_normalized_filtered)
     masked_array = np.ma.array(cm_normalized_filtered, mask=mask)
-    cmap = matplotlib.cm.jet
+    cmap = copy.copy(matplotlib.cm.jet)
     cmap.set_bad('white', 1.)
     im = ax.imshow(masked_array, interpolation='nearest', cmap=cmap)
 
@@ -171,10 +168,7 @@ def plot_confusion_matrix(cm, NetworkTypeLabels, sub_to_main_type, isSubType, fi
     f.tight_layout()
     ax.set_ylabel('True label')
     ax.set_xlabel('Predicted label')
-    if not filename:
-        plt.show()
-    else:
-        plt.savefig(filename, bbox_inches='tight')
+    finish(f, filename, bbox_inches='tight')
 
 
 def plot_distance_matrix(distance_m, NetworkTypeLabels, sub_to_main_type, isSubType):
@@ -207,7 +201,7 @@ def plot_distance_matrix(distance_m, NetworkTypeLabels, sub_to_main_type, isSubT
     plt.show()
 
 
-def MDS_plot(distance_matrix, NetworkTypeLabels, sub_to_main_type):
+def MDS_plot(distance_matrix, NetworkTypeLabels, sub_to_main_type, filename=None):
     mds = manifold.MDS(n_components=2, max_iter=3000, eps=1e-9, dissimilarity="precomputed", n_jobs=1)
     pos = mds.fit(distance_matrix).embedding_
     clf = PCA(n_components=2)
@@ -215,21 +209,23 @@ def MDS_plot(distance_matrix, NetworkTypeLabels, sub_to_main_type):
 
     xs = [x for x, y in pos]
     ys = [y for x, y in pos]
-    plt.scatter(xs, ys)
+    f = new_figure(filename)
+    ax = f.add_subplot(111)
+    ax.scatter(xs, ys)
     Domains = list(set(sub_to_main_type.values()))
     color_map = index_to_color(Domains, "hsv")
 
     for i, type_label in enumerate(NetworkTypeLabels):
         domain = sub_to_main_type[type_label]
         index = Domains.index(domain)
-        plt.annotate(type_label, xy=(xs[i], ys[i]), color=color_map(index))
+        ax.annotate(type_label, xy=(xs[i], ys[i]), color=color_map(index))
 
-    plt.axhline(0)
-    plt.axvline(0)
-    plt.show()
+    ax.axhline(0)
+    ax.axvline(0)
+    finish(f, filename)
 
 
-def plot_2d(X, Y, x_index, y_index, x_label, y_label, xlog_scale=False, ylog_scale=False):
+def plot_2d(X, Y, x_index, y_index, x_label, y_label, xlog_scale=False, ylog_scale=False, filename='plot_2d_.pdf'):
     X = np.array(X)
     Y = np.array(Y)
 
@@ -241,47 +237,48 @@ def plot_2d(X, Y, x_index, y_index, x_label, y_label, xlog_scale=False, ylog_sca
     color_select = lambda x: "r" if x == "seed" else "b"
     marker_select = lambda x: "o" if x == "seed" else ","
 
-    ax = plt.subplot(111)
+    f = new_figure(filename)
+    ax = f.add_subplot(111)
 
     for idx, label in enumerate(ts):
 
         if len(ts) > 2:
             colorVal = color_map(values[idx])
-            plt.scatter(x=X[:, x_index][Y == label],
-                        y=X[:, y_index][Y == label],
-                        color=colorVal,
-                        alpha=0.6,
-                        label=label,
-                        marker=marker_select(label),
-                        s=60,
-                        edgecolors="k"
+            ax.scatter(x=X[:, x_index][Y == label],
+                       y=X[:, y_index][Y == label],
+                       color=colorVal,
+                       alpha=0.6,
+                       label=label,
+                       marker=marker_select(label),
+                       s=60,
+                       edgecolors="k"
             )
         else:
 
-            plt.scatter(x=X[:, x_index][Y == label],
-                        y=X[:, y_index][Y == label],
-                        color=color_select(label),
-                        alpha=0.6,
-                        label=label,
-                        marker=marker_select(label),
-                        s=60,
-                        edgecolors="k"
+            ax.scatter(x=X[:, x_index][Y == label],
+                       y=X[:, y_index][Y == label],
+                       color=color_select(label),
+                       alpha=0.6,
+                       label=label,
+                       marker=marker_select(label),
+                       s=60,
+                       edgecolors="k"
             )
 
-    plt.xlabel(x_label, fontsize=20)
-    plt.ylabel(y_label, fontsize=20)
+    ax.set_xlabel(x_label, fontsize=20)
+    ax.set_ylabel(y_label, fontsize=20)
 
     if xlog_scale:
-        plt.xscale("log")
+        ax.set_xscale("log")
 
     if ylog_scale:
-        plt.yscale("log")
+        ax.set_yscale("log")
 
-    plt.legend(loc='upper right', fancybox=False, prop={'size': 15})  # ,bbox_to_anchor=(1.1, 1.05))
+    ax.legend(loc='upper right', fancybox=False, prop={'size': 15})  # ,bbox_to_anchor=(1.1, 1.05))
+
+    f.tight_layout()
+    finish(f, filename)
 
-    plt.tight_layout
-    # plt.show()
-    plt.savefig('plot_2d_.pdf')
 
 def plot_scikit_lda(X, Y):
     ts = set(Y)
@@ -333,19 +330,18 @@ def plot_scikit_lda_3d(X, Y):
     plt.show()
 
 
-def matrix_clustering(D, leave_name):
+def matrix_clustering(D, leave_name, filename='dendrogram.png'):
     # Compute and plot first dendrogram.
-    fig = pylab.figure(figsize=(10, 10))
+    fig = new_figure(filename, figsize=(10, 10))
     ax1 = fig.add_axes([0.00, 0.1, 0.2, 0.6])
     Y = sch.linkage(D)  # , method='centroid')
-    Z1 = sch.dendrogram(Y, orientation='right')
+    Z1 = sch.dendrogram(Y, orientation='right', ax=ax1)
     ax1.set_xticks([])
     ax1.set_yticks([])
 
-    # Compute and plot second dendrogram.
+    # Plot second dendrogram, from the same linkage.
     ax2 = fig.add_axes([0.3, 0.71, 0.6, 0.05])
-    Y = sch.linkage(D)  # , method='centroid')
-    Z2 = sch.dendrogram(Y)
+    Z2 = sch.dendrogram(Y, ax=ax2)
     ax2.set_xticks([])
     ax2.set_yticks([])
 
@@ -366,17 +362,15 @@ def matrix_clustering(D, leave_name):
     tick_marks = np.arange(len(axis_labels))
     axmatrix.yaxis.set_label_position('right')
     axmatrix.set_yticks(tick_marks)
-    axmatrix.set_yticklabels(axis_labels)
-    pylab.yticks(fontsize=7)
+    axmatrix.set_yticklabels(axis_labels, fontsize=7)
 
     # Plot colorbar.
     axcolor = fig.add_axes([0.91, 0.1, 0.02, 0.6])
-    pylab.colorbar(im, cax=axcolor)
-    fig.show()
-    fig.savefig('dendrogram.png', bbox_inches='tight')
+    fig.colorbar(im, cax=axcolor)
+    finish(fig, filename, bbox_inches='tight')
 
 
-def plot_feature_importance(Ls, feature_order):
+def plot_feature_importance(Ls, feature_order, filename="yo_.pdf"):
     """
     Plot aggregated rankings of feature importance. The height of a color bar indicates a frequency of the corresponding
     specific feature being at the rank. The importance decreases along the _x_-axis.
@@ -384,21 +378,21 @@ def plot_feature_importance(Ls, feature_order):
     Parameters
     ----------
     Ls
+        either a list of rankings (lists of (importance, feature name) tuples) or a rank-frequency matrix of shape
+        (# of features, # of ranks), e.g. RunAggregator.rank_frequency.
     feature_order
+    filename
+        output path of the plot, or `None` to show it.
 
     Returns
     -------
 
     """
-    plt.subplots(figsize=(6, 4), dpi=150)
-    Ls = list(map(lambda x: list(map(lambda y: y[1], x)), Ls))
-    Ls = zip(*Ls)
-
-    freq = {f: [] for f in feature_order}
+    f = new_figure(filename, figsize=(6, 4), dpi=150)
+    ax = f.add_subplot(111)
+    frequency = Ls if isinstance(Ls, np.ndarray) else rank_frequency(Ls, feature_order)
 
-    for freq_fs in Ls:
-        for f in feature_order:
-            freq[f].append(freq_fs.count(f))
+    freq = {f: frequency[i].tolist() for i, f in enumerate(feature_order)}
 
     color_map = index_to_color(freq.keys(), "jet")
     # raise Exception
@@ -407,7 +401,7 @@ def plot_feature_importance(Ls, feature_order):
 
     first = iterate[0]
     colorVal = color_map(0)
-    p = plt.bar(list(range(1, len(feature_order) + 1)), list(map(float, freq[first])), 0.35, color=colorVal)
+    p = ax.bar(list(range(1, len(feature_order) + 1)), list(map(float, freq[first])), 0.35, color=colorVal)
 
     prev = freq[first]  # previous stack
 
@@ -416,7 +410,7 @@ def plot_feature_importance(Ls, feature_order):
 
     for i, k in enumerate(iterate[1:]):
         colorVal = color_map(i + 1)
-        p = plt.bar(range(1, len(feature_order) + 1), list(map(float, freq[k])), 0.35, color=colorVal, bottom=list(map(float, prev)))
+        p = ax.bar(range(1, len(feature_order) + 1), list(map(float, freq[k])), 0.35, color=colorVal, bottom=list(map(float, prev)))
         who_is_dominant.append(list(map(lambda x: (k, x), freq[k])))
         prev = list(map(lambda x: x[0] + x[1], zip(prev, freq[k])))
         ps.append(p)
@@ -426,14 +420,14 @@ def plot_feature_importance(Ls, feature_order):
     for rank in zip(*who_is_dominant):
         ranking.append(sorted(rank, key=lambda x: x[1], reverse=True))
 
-    # plt.legend(ps, iterate, prop={'size': 16}, loc='lower right', bbox_to_anchor=(1.1, 0))
-    plt.tick_params(axis='x', labelsize=14)
-    plt.tick_params(axis='y', labelsize=14)
-    plt.xlim(0.75, len(ranking) + 0.5)
-    plt.xlabel('feature importance', fontsize=12)
-    plt.ylabel('frequency', fontsize=22)
+    # ax.legend(ps, iterate, prop={'size': 16}, loc='lower right', bbox_to_anchor=(1.1, 0))
+    ax.tick_params(axis='x', labelsize=14)
+    ax.tick_params(axis='y', labelsize=14)
+    ax.set_xlim(0.75, len(ranking) + 0.5)
+    ax.set_xlabel('feature importance', fontsize=12)
+    ax.set_ylabel('frequency', fontsize=22)
 
-    plt.savefig("yo_.pdf")
+    finish(f, filename)
 
     return ranking
 
@@ -460,8 +454,8 @@ def main2(csv, features):
     exclusive_types = ["Economic"]
     isSubType = True
     at_least = 0
-    X, Y, sub_to_main_type, feature_order = init(csv_file, column_names, isSubType, at_least,
-                                                 exclusive_types=exclusive_types)
+    X, Y, sub_to_main_type, feature_order = init_cached(csv_file, column_names, isSubType, at_least,
+                                                        exclusive_types=exclusive_types)
     x_index = list(feature_order).index(x_label)
     y_index = list(feature_order).index(y_label)
     # x_index = 0  # TODO: hot-fix
@@ -1,7 +1,6 @@
 import csv
+import warnings
 import numpy as np
-from collections import Counter
-from sklearn.feature_extraction import DictVectorizer
 
 
 def data_read(filepath, *features, **kwargs):
@@ -65,17 +64,102 @@ def filter_float(network_dict):
     return network_dict
 
 
+def read_columns(filepath, *features, **kwargs):
+    """
+    Columnar counterpart of data_read. Read only the requested columns of a csv file (features.csv) into arrays.
+
+    Rows are read in chunks, and a row is dropped if any requested column is empty or "nan", or if its NetworkType is
+    one of the exclusive_types. As in data_read, a row whose .gmlFile appears again later in the file is replaced by
+    the later one.
+
+    Parameters
+    ----------
+    filepath:
+        path to a file containing feature values (e.g. features.csv).
+    features:
+        names of columns to be read, including "NetworkType" and "SubType".
+    kwargs:
+        exclusive_types: a list of network types to be skipped.
+        chunk_size: number of rows parsed at a time (default 100000).
+
+    Returns
+    -------
+    X:
+        float64 numpy array for features. Columns are sorted by feature name.
+    labels:
+        numpy array of (gml file name, NetworkType, SubType) for every row of X.
+    feature_order:
+        a list of strings (features' names) ordered for the feature array X.
+
+    """
+    label_names = [".gmlFile", "NetworkType", "SubType"]
+    feature_order = sorted(f for f in features if f not in label_names)
+    chunk_size = kwargs.get("chunk_size", 100000)
+
+    with open(filepath, 'r') as f:
+        header = next(csv.reader([f.readline()]))
+        missing = [name for name in label_names + feature_order if name not in header]
+        if missing:
+            raise ValueError("columns not found in %s: %s" % (filepath, ", ".join(missing)))
+
+        usecols = [header.index(name) for name in label_names + feature_order]
+        checked = [i for i, name in enumerate(label_names) if name in features]
+
+        X_chunks = []
+        label_chunks = []
+        while True:
+            with warnings.catch_warnings():
+                # loadtxt warns when the end of the file falls exactly on a chunk boundary.
+                warnings.simplefilter("ignore", UserWarning)
+                # no comment character: '#' may appear in any field, e.g. in a network name.
+                chunk = np.loadtxt(f, delimiter=',', quotechar='"', comments=None, dtype=str, usecols=usecols,
+                                   ndmin=2, max_rows=chunk_size)
+            if len(chunk) == 0:
+                break
+
+            labels, values = chunk[:, :len(label_names)], chunk[:, len(label_names):]
+            keep = ~((values == "") | (values == "nan")).any(axis=1)
+            keep &= ~((labels[:, checked] == "") | (labels[:, checked] == "nan")).any(axis=1)
+            keep &= ~np.isin(labels[:, 1], kwargs.get("exclusive_types", []))
+
+            X_chunks.append(values[keep].astype(np.float64))
+            label_chunks.append(labels[keep])
+
+            if len(chunk) < chunk_size:
+                break
+
+    if not X_chunks:
+        return np.empty((0, len(feature_order))), np.empty((0, len(label_names)), dtype=str), feature_order
+
+    X = np.concatenate(X_chunks, axis=0)
+    labels = np.concatenate(label_chunks, axis=0)
+
+    # a .gmlFile keeps the position of its first occurrence and the values of its last one, as in a dict.
+    names = labels[:, 0]
+    _, first = np.unique(names, return_index=True)
+    _, last_reversed = np.unique(names[::-1], return_index=True)
+    if len(first) < len(names):
+        last = len(names) - 1 - last_reversed
+        rows = last[np.argsort(first)]
+        X, labels = X[rows], labels[rows]
+
+    return X, labels, feature_order
+
+
 def XY_filter_unpopular(X, Y, threshold):
     """
     filters out the elements which are unpopular (i.e. # of ys is below threshold).
+    The remaining elements are grouped by class, the most popular class first.
     """
-    counts = Counter(Y)
-    popular = [item[0] for item in counts.most_common() if item[1] > threshold]
+    classes, first, inverse, counts = np.unique(Y, return_index=True, return_inverse=True, return_counts=True)
+
+    # rank classes as Counter.most_common does: by count, ties broken by first appearance.
+    popularity = np.empty(len(classes), dtype=np.intp)
+    popularity[np.lexsort((first, -counts))] = np.arange(len(classes))
 
-    # popular = []  # TODO: ad-hoc fix
-    # popular = [elem for (elem, count) in filter(lambda (e, c): c > threshold, counts.most_common())]
-    return np.concatenate(tuple(X[Y == p] for p in popular), axis=0), \
-           np.concatenate(tuple(Y[Y == p] for p in popular), axis=0)
+    rows = np.flatnonzero(counts[inverse] > threshold)
+    rows = rows[np.argsort(popularity[inverse[rows]], kind="stable")]
+    return X[rows], Y[rows]
 
 
 def init(filepath, column_names, isSubType, at_least, **kwargs):
@@ -106,24 +190,17 @@ def init(filepath, column_names, isSubType, at_least, **kwargs):
         That is, columns of X correspond to feature_order.
 
     """
-    network_dict = data_read(filepath, *column_names, **kwargs)
-
-    network_dict = filter_float(network_dict)
-    # print("network_dict = ", network_dict)
-    features, labels = XY_generator(network_dict)
-
-    v = DictVectorizer(sparse=False)
-    # print("features = ", features)
-    X = v.fit_transform(features)
-
-    feature_order = map(lambda x: x[0], sorted(v.vocabulary_.items(), key=lambda x: x[1]))
+    X, labels, feature_order = read_columns(filepath, *column_names, **kwargs)
 
-    sub_to_main_type = dict((SubType, NetworkType) for gml, NetworkType, SubType in labels)
+    # the last row of each sub-type decides its network type.
+    _, last = np.unique(labels[::-1, 2], return_index=True)
+    last = len(labels) - 1 - last
+    sub_to_main_type = dict(zip(labels[last, 2].tolist(), labels[last, 1].tolist()))
 
     if isSubType:
-        Y = np.array([SubType for gml, NetworkType, SubType in labels])
+        Y = labels[:, 2]
     else:
-        Y = np.array([NetworkType for gml, NetworkType, SubType in labels])
+        Y = labels[:, 1]
 
     X, Y = XY_filter_unpopular(X, Y, at_least)
 
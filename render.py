@@ -0,0 +1,78 @@
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from parallel import parallel_map
+
+
+def new_figure(filename=None, **kwargs):
+    """
+    Create a figure to draw on.
+
+    Figures that will be saved to a file are plain Agg figures that never touch the global pyplot state, so they
+    work on headless machines and are freed as soon as they are finished. Figures without a filename are pyplot
+    figures, to be shown interactively.
+
+    Parameters
+    ----------
+    filename:
+        path the figure will be saved to, or `None` to show it.
+    kwargs:
+        arguments of matplotlib.figure.Figure, e.g. figsize and dpi.
+
+    Returns
+    -------
+    fig: `matplotlib.figure.Figure`
+
+    """
+    if filename is None:
+        return plt.figure(**kwargs)
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def finish(fig, filename=None, **kwargs):
+    """
+    Save a figure created by new_figure (or show it if filename is `None`) and release it.
+
+    Parameters
+    ----------
+    fig: `matplotlib.figure.Figure`
+    filename:
+        output path; the format is taken from its extension.
+    kwargs:
+        arguments of savefig, e.g. bbox_inches.
+
+    """
+    if filename is None:
+        plt.show()
+        plt.close(fig)
+    else:
+        fig.savefig(filename, **kwargs)
+        fig.clf()
+
+
+def _render(job):
+    func, args, kwargs = job
+    return func(*args, **kwargs)
+
+
+def render_many(jobs, n_jobs=1):
+    """
+    Render many figures, optionally over a pool of processes.
+
+    Parameters
+    ----------
+    jobs:
+        an iterable of (func, args, kwargs), where func is a module-level plotting function such as
+        plot.plot_confusion_matrix and kwargs contains its filename.
+    n_jobs: `int`
+        number of worker processes. -1 uses all CPUs.
+
+    Returns
+    -------
+    results: `list`
+        return values of the plotting functions, in the order of jobs.
+
+    """
+    return list(parallel_map(_render, jobs, n_jobs=n_jobs))
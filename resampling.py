@@ -0,0 +1,129 @@
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+
+# names of the sampling methods of multiclass_classification.
+SAMPLING_METHODS = ("None", "RandomOver", "RandomUnder", "SMOTE")
+
+
+class Resampler(object):
+    """
+    Class balancing of a training set with the sampling methods of multiclass_classification.
+
+    RandomOver and RandomUnder only draw row indices, so the resampled set is gathered from X with a single copy.
+    SMOTE brings every class to the size of the largest one in a single pass: synthetic samples of all the minority
+    classes are interpolated together between random members and one of their k nearest neighbours in the same
+    class, searched once per class.
+
+    Parameters
+    ----------
+    X:
+        numpy array of features.
+    y:
+        numpy array of class labels.
+    index:
+        rows of X and y forming the training set, or `None` for all of them.
+    k_neighbors: `int`
+        number of nearest neighbours of SMOTE.
+
+    Attributes
+    ----------
+    classes:
+        sorted class labels of the training set.
+    members:
+        for every class, the rows of X of its training samples.
+
+    """
+
+    def __init__(self, X, y, index=None, k_neighbors=3):
+        self.X = X
+        self.y = np.asarray(y)
+        self.index = np.arange(len(self.y)) if index is None else np.asarray(index)
+        self.k_neighbors = k_neighbors
+        self.classes, codes = np.unique(self.y[self.index], return_inverse=True)
+        self.members = [self.index[codes == c] for c in range(len(self.classes))]
+
+    def neighbors(self, c):
+        """
+        Rows of X of the nearest neighbours of every member of class number c within the class, of shape
+        (# of members, k) with k at most k_neighbors. A class with a single member is its own neighbour.
+        """
+        members = self.members[c]
+        k = min(self.k_neighbors, len(members) - 1)
+        if k < 1:
+            return members[:, None]
+        X_class = np.asarray(self.X[members], dtype=np.float64)
+        _, nearest = NearestNeighbors(n_neighbors=k + 1).fit(X_class).kneighbors(X_class)
+        # the first neighbour of every sample is itself.
+        return members[nearest[:, 1:]]
+
+    def sample_indices(self, method, random_state=None):
+        """
+        Rows of X of a resampled training set, for the methods that do not create samples.
+
+        Parameters
+        ----------
+        method: `str`
+            "None", "RandomOver" (every class drawn with replacement up to the size of the largest one) or
+            "RandomUnder" (every class drawn without replacement down to the size of the smallest one).
+        random_state:
+            seed of the draws.
+
+        Returns
+        -------
+        rows: numpy array of indices.
+
+        """
+        rng = np.random.default_rng(random_state)
+        counts = [len(members) for members in self.members]
+        if method == "None":
+            return self.index
+        if method == "RandomOver":
+            target = max(counts)
+            return np.concatenate(self.members + [members[rng.integers(0, len(members), target - len(members))]
+                                                  for members in self.members])
+        if method == "RandomUnder":
+            target = min(counts)
+            return np.concatenate([rng.choice(members, target, replace=False) for members in self.members])
+        raise ValueError("unknown sampling method without synthetic samples: %s" % method)
+
+    def sample(self, method, random_state=None):
+        """
+        Resampled training set.
+
+        Parameters
+        ----------
+        method: `str`
+            one of SAMPLING_METHODS.
+        random_state:
+            seed of the draws.
+
+        Returns
+        -------
+        sampled_x: numpy array for features of the resampled training set.
+        sampled_y: numpy array for class labels of the resampled training set.
+
+        """
+        if method != "SMOTE":
+            rows = self.sample_indices(method, random_state=random_state)
+            return self.X[rows], self.y[rows]
+
+        rng = np.random.default_rng(random_state)
+        target = max(len(members) for members in self.members)
+        bases, neighbors = [], []
+        for c, members in enumerate(self.members):
+            n_new = target - len(members)
+            if not n_new:
+                continue
+            base = rng.integers(0, len(members), n_new)
+            nearest = self.neighbors(c)
+            bases.append(members[base])
+            neighbors.append(nearest[base, rng.integers(0, nearest.shape[1], n_new)])
+
+        X_train, y_train = self.X[self.index], self.y[self.index]
+        if not bases:
+            return X_train, y_train
+        bases, neighbors = np.concatenate(bases), np.concatenate(neighbors)
+        X_base = np.asarray(self.X[bases], dtype=np.float64)
+        synthetic = X_base + rng.random((len(bases), 1)) * (self.X[neighbors] - X_base)
+        return np.concatenate((X_train, synthetic)), np.concatenate((y_train, self.y[bases]))
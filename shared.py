@@ -0,0 +1,91 @@
+import mmap
+import numpy as np
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from parallel import effective_jobs
+
+
+# shared memory blocks attached by this process, kept open as long as the arrays built on them are in use.
+_attached = {}
+
+
+def _is_mapped_file(array):
+    """
+    True for an array memory-mapped from a whole file by np.load or np.memmap (not a view of one).
+    """
+    return isinstance(array, np.memmap) and isinstance(array.base, mmap.mmap) and array.filename is not None \
+        and array.flags.c_contiguous
+
+
+@contextmanager
+def broadcast(arrays, n_jobs=1):
+    """
+    Make arrays available to worker processes without pickling them into every worker or task.
+
+    Arrays memory-mapped from files (e.g. loaded by feature_store.load_store) are shared by file name, since the
+    workers can map the same pages; other arrays are copied once into multiprocessing.shared_memory blocks, which
+    are released when the context exits. With a single job, the arrays themselves are handed over.
+
+    Parameters
+    ----------
+    arrays: `dict`
+        name -> numpy array (numeric or fixed-width string dtype).
+    n_jobs: `int`
+        number of worker processes that will attach to the arrays.
+
+    Returns
+    -------
+    handles: `dict`
+        name -> small picklable description of the array, to be passed to attach in the workers.
+
+    """
+    if effective_jobs(n_jobs) == 1:
+        yield dict((name, ("array", array)) for name, array in arrays.items())
+        return
+
+    handles = {}
+    blocks = []
+    try:
+        for name, array in arrays.items():
+            if _is_mapped_file(array):
+                handles[name] = ("memmap", array.filename, array.dtype.str, array.shape, array.offset)
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            handles[name] = ("shm", block.name, array.dtype.str, array.shape)
+        yield handles
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def attach(handles):
+    """
+    Read-only arrays from the handles made by broadcast.
+
+    Returns
+    -------
+    arrays: `dict`
+        name -> numpy array.
+
+    """
+    arrays = {}
+    for name, handle in handles.items():
+        kind = handle[0]
+        if kind == "array":
+            arrays[name] = handle[1]
+        elif kind == "memmap":
+            filename, dtype, shape, offset = handle[1:]
+            arrays[name] = np.memmap(filename, dtype=np.dtype(dtype), mode='r', shape=shape, offset=offset)
+        else:
+            block_name, dtype, shape = handle[1:]
+            if block_name not in _attached:
+                # workers share the resource tracker of the process that created the block, which unlinks it.
+                _attached[block_name] = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[block_name].buf)
+            array.flags.writeable = False
+            arrays[name] = array
+    return arrays